@@ -0,0 +1,106 @@
+import time
+
+# Registro de alterações (change feed). Gatilhos em cada tabela de usuário
+# acrescentam uma linha em _changelog a cada INSERT, UPDATE e DELETE, com um
+# número de sequência que só cresce (AUTOINCREMENT nunca reaproveita valores,
+# nem depois da compactação). Um consumidor guarda o último seq que viu e pede
+# só o que veio depois.
+#
+# A compactação mantém só a alteração mais recente de cada registro, o que não
+# muda o resultado para nenhum consumidor: quem pede "depois de S" recebe o
+# estado final de tudo que mudou depois de S. Exclusões (tombstones) mais
+# antigas que a retenção são apagadas; o maior seq apagado vira o horizonte, e
+# consumidores parados antes dele precisam baixar as tabelas de novo.
+
+# Tabelas do registro, criadas por uma migração (ver migracoes.py)
+def criar_registro_alteracoes(conn):
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS _changelog (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        tabela TEXT NOT NULL,
+        id TEXT NOT NULL,
+        operacao TEXT NOT NULL,
+        quando REAL NOT NULL
+    )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS _changelog_registro ON _changelog (tabela, id)")
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS _changelog_estado (
+        chave TEXT PRIMARY KEY,
+        valor INTEGER NOT NULL
+    )
+    ''')
+
+# Gatilhos das tabelas de usuário, criados pelo servidor para cada tabela com
+# id que encontrar (ver instalar_gatilhos em servidor.py)
+def garantir_gatilhos_alteracoes(conn, tabelas):
+    # Segundos desde 1970 com frações, em qualquer versão do SQLite
+    agora = "(julianday('now') - 2440587.5) * 86400.0"
+    for tabela in tabelas:
+        registrar = (
+            f"INSERT INTO _changelog (tabela, id, operacao, quando) VALUES ('{tabela}', {{id}}, '{{operacao}}', {agora});"
+        )
+        conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS _changelog_{tabela}_ai AFTER INSERT ON "{tabela}" BEGIN
+            {registrar.format(id='new.id', operacao='insert')}
+        END
+        ''')
+        conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS _changelog_{tabela}_au AFTER UPDATE ON "{tabela}" BEGIN
+            {registrar.format(id='new.id', operacao='update')}
+        END
+        ''')
+        # Um UPDATE que troca o id é, para os consumidores, a exclusão do id antigo
+        conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS _changelog_{tabela}_au_id AFTER UPDATE OF id ON "{tabela}"
+        WHEN old.id IS NOT new.id BEGIN
+            {registrar.format(id='old.id', operacao='delete')}
+        END
+        ''')
+        conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS _changelog_{tabela}_ad AFTER DELETE ON "{tabela}" BEGIN
+            {registrar.format(id='old.id', operacao='delete')}
+        END
+        ''')
+
+def horizonte(conn):
+    row = conn.execute("SELECT valor FROM _changelog_estado WHERE chave = 'horizonte'").fetchone()
+    return row[0] if row else 0
+
+def ultimo_seq(conn):
+    row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = '_changelog'").fetchone()
+    return row[0] if row else 0
+
+# Alterações com seq maior que "desde", em ordem, opcionalmente de uma tabela só
+def listar_alteracoes(conn, desde, limite, tabela=None):
+    sql = "SELECT seq, tabela, id, operacao, quando FROM _changelog WHERE seq > ?"
+    parametros = [desde]
+    if tabela is not None:
+        sql += " AND tabela = ?"
+        parametros.append(tabela)
+    sql += " ORDER BY seq LIMIT ?"
+    parametros.append(limite)
+    return conn.execute(sql, parametros).fetchall()
+
+# Compacta o registro e devolve quantas linhas foram apagadas
+def compactar(conn, retencao_dias):
+    # Só a alteração mais recente de cada registro importa
+    removidas = conn.execute('''
+    DELETE FROM _changelog WHERE seq NOT IN (
+        SELECT MAX(seq) FROM _changelog GROUP BY tabela, id
+    )
+    ''').rowcount
+
+    limite = time.time() - retencao_dias * 86400
+    maior_tombstone = conn.execute(
+        "SELECT MAX(seq) FROM _changelog WHERE operacao = 'delete' AND quando < ?", (limite,)
+    ).fetchone()[0]
+    if maior_tombstone is not None:
+        removidas += conn.execute(
+            "DELETE FROM _changelog WHERE operacao = 'delete' AND seq <= ?", (maior_tombstone,)
+        ).rowcount
+        conn.execute('''
+        INSERT INTO _changelog_estado (chave, valor) VALUES ('horizonte', ?)
+        ON CONFLICT(chave) DO UPDATE SET valor = MAX(valor, excluded.valor)
+        ''', (maior_tombstone,))
+    return removidas
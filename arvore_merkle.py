@@ -0,0 +1,135 @@
+import hashlib
+import json
+
+# Árvore de hashes (Merkle) do conteúdo de uma tabela, usada pelo
+# sincronizar_banco.py para achar as diferenças entre o banco local e o do
+# Render sem baixar as tabelas inteiras. Cada registro cai em um balde pelo
+# hash do seu id: o prefixo hexadecimal desse hash é o caminho na árvore, com
+# 16 filhos por nó. Assim os baldes têm o mesmo tamanho qualquer que seja o
+# formato dos ids. O hash de um nó é o XOR dos hashes dos seus registros, e os
+# dois lados chegam ao mesmo valor sem depender da ordem de leitura.
+
+FOLHA_PADRAO = 32
+DIGITOS = '0123456789abcdef'
+PROFUNDIDADE_MAXIMA = 8
+
+def _digest(texto):
+    return hashlib.blake2b(texto.encode('utf-8'), digest_size=8)
+
+def balde(id_registro):
+    return _digest(str(id_registro)).hexdigest()
+
+# O mesmo valor pode estar guardado com tipos diferentes dos dois lados (coluna
+# TEXT no banco local, INTEGER no servidor) e o JSON com outra ordem de chaves
+def normalizar(valor):
+    if isinstance(valor, str):
+        if valor[:1] in ('{', '['):
+            try:
+                return json.dumps(json.loads(valor), sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+            except ValueError:
+                pass
+        return valor
+    if valor is None:
+        return None
+    if isinstance(valor, bytes):
+        return valor.hex()
+    return str(valor)
+
+# Hash do registro; os valores seguem a ordem das colunas comparadas. Cada
+# valor entra prefixado pelo tamanho, para que nenhuma combinação de textos
+# produza a mesma sequência ("-" marca NULL)
+def hash_registro(id_registro, valores):
+    partes = [str(id_registro)]
+    for valor in valores:
+        valor = normalizar(valor)
+        partes.append('-' if valor is None else f'{len(valor)}:{valor}')
+    return int.from_bytes(_digest('|'.join(partes)).digest(), 'big')
+
+def formatar_hash(valor):
+    return f'{valor:016x}'
+
+class ArvoreMerkle:
+    def __init__(self, folha=FOLHA_PADRAO):
+        self.folha = folha
+        self.profundidade = 0
+        # prefixo -> [hash, total], para os prefixos até a profundidade
+        self.nos = {}
+        # prefixo com a profundidade completa -> {id: (balde, hash)}
+        self.baldes = {}
+
+    # linhas: (id, valores) com os valores na ordem das colunas comparadas
+    @classmethod
+    def construir(cls, linhas, folha=FOLHA_PADRAO):
+        arvore = cls(folha)
+        registros = [(str(id_registro), balde(id_registro), hash_registro(id_registro, valores))
+                     for id_registro, valores in linhas]
+        profundidade = 1
+        while len(registros) > folha * 16 ** profundidade and profundidade < PROFUNDIDADE_MAXIMA:
+            profundidade += 1
+        arvore.profundidade = profundidade
+
+        # Os registros entram nos baldes do último nível; os níveis de cima
+        # são montados a partir deles
+        for id_registro, caminho, valor in registros:
+            arvore.baldes.setdefault(caminho[:profundidade], {})[id_registro] = (caminho, valor)
+        nivel = {}
+        for prefixo, registros_balde in arvore.baldes.items():
+            valor = 0
+            for _, hash_valor in registros_balde.values():
+                valor ^= hash_valor
+            nivel[prefixo] = [valor, len(registros_balde)]
+        arvore.nos.update(nivel)
+        for _ in range(profundidade):
+            acima = {}
+            for prefixo, (valor, total) in nivel.items():
+                no = acima.setdefault(prefixo[:-1], [0, 0])
+                no[0] ^= valor
+                no[1] += total
+            arvore.nos.update(acima)
+            nivel = acima
+        return arvore
+
+    # (hash, total) do nó
+    def no(self, prefixo):
+        if len(prefixo) <= self.profundidade:
+            valor, total = self.nos.get(prefixo, (0, 0))
+            return valor, total
+        valor = total = 0
+        for caminho, hash_valor in self.baldes.get(prefixo[:self.profundidade], {}).values():
+            if caminho.startswith(prefixo):
+                valor ^= hash_valor
+                total += 1
+        return valor, total
+
+    # {id: hash} dos registros do nó
+    def registros(self, prefixo):
+        if len(prefixo) >= self.profundidade:
+            return {
+                id_registro: valor
+                for id_registro, (caminho, valor) in self.baldes.get(prefixo[:self.profundidade], {}).items()
+                if caminho.startswith(prefixo)
+            }
+        resultado = {}
+        for chave, registros in self.baldes.items():
+            if chave.startswith(prefixo):
+                resultado.update((id_registro, valor) for id_registro, (_, valor) in registros.items())
+        return resultado
+
+    # Descrição do nó enviada pelo servidor: hash, total e os filhos não
+    # vazios; em nós pequenos, o hash de cada registro
+    def descrever(self, prefixo):
+        valor, total = self.no(prefixo)
+        descricao = {'hash': formatar_hash(valor), 'total': total}
+        if total <= self.folha:
+            descricao['registros'] = {
+                id_registro: formatar_hash(hash_valor)
+                for id_registro, hash_valor in self.registros(prefixo).items()
+            }
+            return descricao
+        filhos = {}
+        for digito in DIGITOS:
+            valor_filho, total_filho = self.no(prefixo + digito)
+            if total_filho:
+                filhos[prefixo + digito] = {'hash': formatar_hash(valor_filho), 'total': total_filho}
+        descricao['filhos'] = filhos
+        return descricao
@@ -0,0 +1,226 @@
+"""Teste de carga HTTP da API: popula a tabela churches, sobe o servidor local
+e mede req/s e latências (p50/p95/p99) de cada rota em várias concorrências.
+
+Uso: python benchmarks/carga_http.py [--tamanhos 1000,10000,100000]
+         [--concorrencias 1,8,32] [--requisicoes 2000] [--servidor gunicorn|asgi]
+         [--workers 2] [--threads 1] [--saida resultados.json]
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import shutil
+import signal
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from migracoes import aplicar_migracoes
+
+SANTOS = ['São José', 'Nossa Senhora de Fátima', 'Santo António', 'São Pedro', 'Sagrado Coração']
+RUAS = ['Rua das Flores', 'Avenida Central', 'Praça da Sé', 'Travessa do Carmo', 'Largo São Bento']
+
+def registro(i, gerador):
+    return (
+        f'igreja{i:06d}',
+        f'Igreja {gerador.choice(SANTOS)} {i}',
+        f'{gerador.choice(RUAS)}, {gerador.randint(1, 999)}',
+        str(gerador.randint(1900, 2024)),
+        gerador.choice(['Sim', 'Não']),
+        gerador.choice(['Sim', 'Não']),
+        gerador.randint(0, 1),
+        json.dumps({'telefone': str(gerador.randint(200000000, 999999999)), 'visitas': gerador.randint(1, 30)})
+    )
+
+# Cria o banco com o esquema do servidor e as linhas pedidas, mais as que o
+# cenário de DELETE vai excluir
+def popular_banco(caminho, linhas, extras):
+    gerador = random.Random(42)
+    conn = sqlite3.connect(caminho)
+    aplicar_migracoes(conn)
+    conn.executemany(
+        "INSERT INTO churches (id, nome, morada, ano, agendamento, autorizadoFilippi, arquivada, dados) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        (registro(i, gerador) for i in range(linhas + extras))
+    )
+    conn.commit()
+    conn.close()
+
+def iniciar_servidor(modo, porta, workers, threads, banco):
+    ambiente = dict(os.environ, DATABASE_URL=banco, PORT=str(porta))
+    # Mesmos comandos do start.sh
+    comando = [sys.executable, '-m', 'gunicorn', '--bind', f'127.0.0.1:{porta}',
+               '--workers', str(workers), '--log-level', 'warning']
+    if modo == 'asgi':
+        comando += ['-k', 'uvicorn.workers.UvicornWorker', 'servidor_asgi:app']
+    else:
+        # Com mais de uma thread o gunicorn usa workers gthread
+        comando += ['--threads', str(threads), 'servidor:app']
+    processo = subprocess.Popen(comando, cwd=RAIZ, env=ambiente,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    limite = time.time() + 60
+    while time.time() < limite:
+        try:
+            conexao = http.client.HTTPConnection('127.0.0.1', porta, timeout=1)
+            conexao.request('GET', '/ping')
+            if conexao.getresponse().status == 200:
+                conexao.close()
+                return processo
+        except OSError:
+            time.sleep(0.1)
+    processo.kill()
+    raise RuntimeError('O servidor não respondeu a /ping em 60 s')
+
+def parar_servidor(processo):
+    processo.send_signal(signal.SIGTERM)
+    try:
+        processo.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        processo.kill()
+
+# Cada cenário devolve (método, caminho, corpo) da i-ésima requisição
+def cenarios(linhas, gerador):
+    def aleatorio():
+        return f'igreja{gerador.randrange(linhas):06d}'
+    corpo_put = lambda i: json.dumps({'nome': f'Igreja Atualizada {i}', 'arquivada': i % 2}).encode('utf-8')
+    return {
+        'get_all_pagina': lambda i: ('GET', '/churches?limit=100', None),
+        'get_all_completo': lambda i: ('GET', '/churches', None),
+        'get_one': lambda i: ('GET', f'/churches/{aleatorio()}', None),
+        'put': lambda i: ('PUT', f'/churches/{aleatorio()}', corpo_put(i)),
+        'delete': lambda i: ('DELETE', f'/churches/igreja{linhas + i:06d}', None)
+    }
+
+def percentil(ordenados, p):
+    if not ordenados:
+        return None
+    indice = min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))
+    return round(ordenados[indice] * 1000, 3)
+
+def executar_cenario(porta, requisicao, total, concorrencia, cabecalhos):
+    local = threading.local()
+    latencias = []
+    erros = []
+
+    def enviar(i):
+        conexao = getattr(local, 'conexao', None)
+        if conexao is None:
+            conexao = local.conexao = http.client.HTTPConnection('127.0.0.1', porta, timeout=120)
+        metodo, caminho, corpo = requisicao(i)
+        extras = dict(cabecalhos)
+        if corpo is not None:
+            extras['Content-Type'] = 'application/json'
+        inicio = time.perf_counter()
+        try:
+            conexao.request(metodo, caminho, body=corpo, headers=extras)
+            resposta = conexao.getresponse()
+            resposta.read()
+            status = resposta.status
+        except (OSError, http.client.HTTPException):
+            # Reconecta na próxima requisição desta thread
+            conexao.close()
+            local.conexao = None
+            status = None
+        latencias.append(time.perf_counter() - inicio)
+        if status is None or status >= 400:
+            erros.append(status)
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concorrencia) as executor:
+        list(executor.map(enviar, range(total)))
+    duracao = time.perf_counter() - inicio
+
+    latencias.sort()
+    return {
+        'requisicoes': total,
+        'erros': len(erros),
+        'duracao_s': round(duracao, 3),
+        'req_s': round(total / duracao, 1),
+        'p50_ms': percentil(latencias, 50),
+        'p95_ms': percentil(latencias, 95),
+        'p99_ms': percentil(latencias, 99),
+        'max_ms': percentil(latencias, 100)
+    }
+
+def lista_inteiros(texto):
+    return [int(parte) for parte in texto.split(',') if parte.strip()]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tamanhos', type=lista_inteiros, default=[1000, 10000, 100000])
+    parser.add_argument('--concorrencias', type=lista_inteiros, default=[1, 8, 32])
+    parser.add_argument('--requisicoes', type=int, default=2000,
+                        help='requisições por cenário (get_all_completo usa 1/100, no mínimo 5)')
+    parser.add_argument('--cenarios', default='get_all_pagina,get_all_completo,get_one,put,delete')
+    parser.add_argument('--servidor', choices=['gunicorn', 'asgi'], default='gunicorn')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=1, help='threads por worker do gunicorn (modo gunicorn)')
+    parser.add_argument('--porta', type=int, default=8931)
+    parser.add_argument('--gzip', action='store_true', help='envia Accept-Encoding: gzip')
+    parser.add_argument('--saida', help='arquivo onde gravar o JSON, além da saída padrão')
+    args = parser.parse_args()
+
+    nomes = [nome.strip() for nome in args.cenarios.split(',') if nome.strip()]
+    cabecalhos = {'Accept-Encoding': 'gzip'} if args.gzip else {}
+    total_delete = args.requisicoes * len(args.concorrencias) if 'delete' in nomes else 0
+    resultados = []
+    diretorio = tempfile.mkdtemp(prefix='carga_http_')
+    try:
+        for linhas in args.tamanhos:
+            banco = os.path.join(diretorio, f'churches_{linhas}.db')
+            inicio = time.perf_counter()
+            popular_banco(banco, linhas, total_delete)
+            print(f'{linhas} linhas populadas em {time.perf_counter() - inicio:.1f} s', file=sys.stderr)
+
+            processo = iniciar_servidor(args.servidor, args.porta, args.workers, args.threads, banco)
+            try:
+                gerador = random.Random(linhas)
+                excluidos = 0
+                for concorrencia in args.concorrencias:
+                    for nome in nomes:
+                        requisicao = cenarios(linhas, gerador)[nome]
+                        total = args.requisicoes
+                        if nome == 'get_all_completo':
+                            total = max(5, args.requisicoes // 100)
+                        if nome == 'delete':
+                            # Cada DELETE exclui uma linha extra diferente
+                            deslocamento = excluidos
+                            base = requisicao
+                            requisicao = lambda i, base=base, deslocamento=deslocamento: base(i + deslocamento)
+                            excluidos += total
+                        resultado = executar_cenario(args.porta, requisicao, total, concorrencia, cabecalhos)
+                        resultado.update({'linhas': linhas, 'concorrencia': concorrencia, 'cenario': nome})
+                        resultados.append(resultado)
+                        print(f"{linhas:>7} linhas  c={concorrencia:<3} {nome:<17} "
+                              f"{resultado['req_s']:>9} req/s  p50 {resultado['p50_ms']} ms  "
+                              f"p99 {resultado['p99_ms']} ms  erros {resultado['erros']}", file=sys.stderr)
+            finally:
+                parar_servidor(processo)
+    finally:
+        shutil.rmtree(diretorio, ignore_errors=True)
+
+    relatorio = {
+        'servidor': args.servidor,
+        'workers': args.workers,
+        'threads': args.threads,
+        'gzip': args.gzip,
+        'python': sys.version.split()[0],
+        'sqlite': sqlite3.sqlite_version,
+        'resultados': resultados
+    }
+    saida = json.dumps(relatorio, indent=2, ensure_ascii=False)
+    print(saida)
+    if args.saida:
+        with open(args.saida, 'w', encoding='utf-8') as arquivo:
+            arquivo.write(saida + '\n')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""Compara o serializador padrão do Flask com o ProvedorJSONRapido num payload
+realista da tabela churches.
+
+Uso: python benchmarks/serializador.py [--linhas 10000] [--repeticoes 20]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+from serializador import ProvedorJSONRapido
+
+SANTOS = ['São José', 'Nossa Senhora de Fátima', 'Santo António', 'São Pedro', 'Sagrado Coração']
+RUAS = ['Rua das Flores', 'Avenida Central', 'Praça da Sé', 'Travessa do Carmo', 'Largo São Bento']
+
+# Mesmo formato que get_all devolve para a tabela churches
+def gerar_churches(linhas):
+    random.seed(42)
+    return {
+        f'igreja{i:06d}': {
+            'nome': f'Igreja {random.choice(SANTOS)} {i}',
+            'morada': f'{random.choice(RUAS)}, {random.randint(1, 999)}',
+            'ano': str(random.randint(1900, 2024)),
+            'agendamento': random.choice(['Sim', 'Não']),
+            'autorizadoFilippi': random.choice(['Sim', 'Não']),
+            'arquivada': random.randint(0, 1),
+            'dados': {
+                'telefone': f'{random.randint(200000000, 999999999)}',
+                'responsavel': random.choice(['João Silva', 'Maria Santos', 'Pedro Oliveira']),
+                'visitas': [random.randint(1, 30) for _ in range(5)]
+            }
+        }
+        for i in range(linhas)
+    }
+
+def medir(funcao, repeticoes):
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append(time.perf_counter() - inicio)
+    tempos.sort()
+    return {
+        'mediana_ms': round(tempos[len(tempos) // 2] * 1000, 3),
+        'minimo_ms': round(tempos[0] * 1000, 3)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--linhas', type=int, default=10000)
+    parser.add_argument('--repeticoes', type=int, default=20)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    padrao = DefaultJSONProvider(app)
+    rapido = ProvedorJSONRapido(app)
+    reserva = ProvedorJSONRapido(app)
+    reserva.usar_orjson = False
+
+    dados = gerar_churches(args.linhas)
+    resultados = {
+        'linhas': args.linhas,
+        'bytes': len(padrao.dumps(dados, separators=(',', ':'))),
+        'orjson_instalado': rapido.usar_orjson,
+        'flask_padrao': medir(lambda: padrao.dumps(dados, separators=(',', ':')).encode('utf-8'), args.repeticoes),
+        'rapido_sem_orjson': medir(lambda: reserva.codificar(dados), args.repeticoes),
+        'rapido': medir(lambda: rapido.codificar(dados), args.repeticoes)
+    }
+    resultados['ganho'] = round(
+        resultados['flask_padrao']['mediana_ms'] / resultados['rapido']['mediana_ms'], 2
+    )
+    print(json.dumps(resultados, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+import sqlite3
+
+# Índices de busca textual (FTS5) mantidos por gatilhos sobre a tabela de origem.
+# A tabela FTS usa "external content": guarda só o índice e lê o texto da
+# tabela original pelo rowid. Depois de um VACUUM (que pode renumerar rowids)
+# reconstrua o índice com INSERT INTO _busca_<tabela>(_busca_<tabela>) VALUES('rebuild').
+
+# Trigramas usados, no máximo, na busca aproximada
+MAXIMO_TRIGRAMAS = 8
+
+def nome_indice_busca(tabela):
+    return f'_busca_{tabela}'
+
+# Tokenizador do índice de busca da tabela, ou None se o índice não existir
+def tokenizador_indice(conn, tabela):
+    existente = conn.execute(
+        "SELECT sql FROM sqlite_master WHERE type='table' AND name=?", (nome_indice_busca(tabela),)
+    ).fetchone()
+    if existente is None:
+        return None
+    return 'trigram' if 'trigram' in existente[0] else 'unicode61'
+
+# Cria a tabela FTS5 e os gatilhos, se ainda não existirem, e reindexa a tabela
+# (os gatilhos somem se a tabela de origem for excluída e recriada). Usa o
+# tokenizador trigram (busca por trechos e tolerância a erros de digitação),
+# ignorando acentos a partir do SQLite 3.45; em SQLite sem trigram (< 3.34) cai
+# para unicode61 com índices de prefixo.
+# Devolve o tokenizador em uso, ou None se o SQLite não tiver FTS5.
+# Dentro de uma transação do chamador, o commit fica por conta dele.
+def garantir_indice_busca(conn, tabela, colunas):
+    propria = not conn.in_transaction
+    indice = nome_indice_busca(tabela)
+    lista = ', '.join(colunas)
+    tokenizador = tokenizador_indice(conn, tabela)
+    if tokenizador is None:
+        for opcoes, nome in (
+            ("tokenize='trigram remove_diacritics 1'", 'trigram'),
+            ("tokenize='trigram'", 'trigram'),
+            ("tokenize='unicode61 remove_diacritics 2', prefix='2 3'", 'unicode61')
+        ):
+            try:
+                conn.execute(
+                    f"CREATE VIRTUAL TABLE {indice} USING fts5({lista}, "
+                    f"content='{tabela}', content_rowid='rowid', {opcoes})"
+                )
+                tokenizador = nome
+                break
+            except sqlite3.OperationalError as e:
+                if 'no such module' in str(e):
+                    return None
+                # Tokenizador ou opção não suportados por esta versão: tenta o próximo
+
+        if tokenizador is None:
+            return None
+
+    novos = ', '.join(f'new.{coluna}' for coluna in colunas)
+    antigos = ', '.join(f'old.{coluna}' for coluna in colunas)
+    conn.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS {indice}_ai AFTER INSERT ON {tabela} BEGIN
+        INSERT INTO {indice} (rowid, {lista}) VALUES (new.rowid, {novos});
+    END
+    ''')
+    conn.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS {indice}_ad AFTER DELETE ON {tabela} BEGIN
+        INSERT INTO {indice} ({indice}, rowid, {lista}) VALUES ('delete', old.rowid, {antigos});
+    END
+    ''')
+    # Só reindexa quando uma das colunas indexadas muda
+    conn.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS {indice}_au AFTER UPDATE OF {lista} ON {tabela} BEGIN
+        INSERT INTO {indice} ({indice}, rowid, {lista}) VALUES ('delete', old.rowid, {antigos});
+        INSERT INTO {indice} (rowid, {lista}) VALUES (new.rowid, {novos});
+    END
+    ''')
+
+    # Vocabulário do índice, usado para escolher os trigramas mais raros
+    conn.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {indice}_vocab USING fts5vocab({indice}, row)")
+
+    # Indexa os registros que já existiam
+    conn.execute(f"INSERT INTO {indice} ({indice}) VALUES ('rebuild')")
+    if propria:
+        conn.commit()
+    return tokenizador
+
+def _frase(texto):
+    return '"' + texto.replace('"', '""') + '"'
+
+# Texto literal para um LIKE com ESCAPE '\': % e _ não viram curingas
+def _like(texto):
+    return texto.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def _trigramas(texto):
+    texto = ' '.join(texto.lower().split())
+    vistos = []
+    for i in range(len(texto) - 2):
+        trigrama = texto[i:i + 3]
+        if trigrama.strip() and trigrama not in vistos:
+            vistos.append(trigrama)
+    return vistos
+
+# Busca registros da tabela pelo texto informado, do mais para o menos relevante.
+# Primeiro vêm os registros que contêm o texto (trecho ou início de palavra);
+# se faltarem resultados, completa com os que compartilham trigramas com o
+# texto, o que tolera erros de digitação. Só os trigramas mais raros entram na
+# busca aproximada: são os que mais distinguem os registros e os mais baratos
+# de avaliar.
+def buscar(conn, tabela, colunas, tokenizador, texto, limite):
+    indice = nome_indice_busca(tabela)
+    texto = ' '.join(texto.split())
+    # Ordena e limita só os rowids no índice antes de ler os registros
+    consulta = (
+        f"SELECT t.* FROM (SELECT rowid, rank FROM {indice} WHERE {indice} MATCH ? "
+        f"ORDER BY rank LIMIT ?) f JOIN {tabela} t ON t.rowid = f.rowid ORDER BY f.rank"
+    )
+
+    if tokenizador == 'trigram' and len(texto) < 3:
+        # Trechos com menos de 3 caracteres não geram trigramas: busca com LIKE
+        condicao = ' OR '.join(f"{coluna} LIKE ? ESCAPE '\\'" for coluna in colunas)
+        cursor = conn.execute(
+            f"SELECT * FROM {tabela} WHERE {condicao} LIMIT ?",
+            [f'%{_like(texto)}%'] * len(colunas) + [limite]
+        )
+        return cursor.fetchall()
+
+    if tokenizador == 'trigram':
+        exata = _frase(texto)
+    else:
+        exata = ' '.join(_frase(palavra) + '*' for palavra in texto.split())
+
+    registros = conn.execute(consulta, (exata, limite)).fetchall()
+
+    if tokenizador == 'trigram' and len(registros) < limite:
+        trigramas = _trigramas(texto)
+        if len(trigramas) > 1:
+            frequencias = conn.execute(
+                f"SELECT term, doc FROM {indice}_vocab WHERE term IN ({', '.join(['?'] * len(trigramas))})",
+                trigramas
+            ).fetchall()
+            raros = [termo for termo, _ in sorted(frequencias, key=lambda item: item[1])[:MAXIMO_TRIGRAMAS]]
+        else:
+            raros = []
+        if raros:
+            encontrados = {registro['id'] for registro in registros}
+            aproximada = ' OR '.join(_frase(trigrama) for trigrama in raros)
+            for registro in conn.execute(consulta, (aproximada, limite + len(registros))).fetchall():
+                if registro['id'] not in encontrados and len(registros) < limite:
+                    registros.append(registro)
+
+    return registros
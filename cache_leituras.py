@@ -0,0 +1,103 @@
+import threading
+from collections import OrderedDict
+
+# Cache LRU das respostas de leitura (GET /<tabela> e GET /<tabela>/<id>),
+# guardadas já serializadas e limitadas pelo total de bytes. Cada entrada
+# registra a versão da tabela em que foi gerada e só é servida enquanto essa
+# versão continuar sendo a atual.
+class CacheLeituras:
+    def __init__(self, limite_bytes):
+        self.limite_bytes = limite_bytes
+        self._entradas = OrderedDict()
+        self._por_tabela = {}
+        self._versoes = {}
+        # Invalidações por tabela, para descartar versões lidas antes delas
+        self._geracoes = {}
+        self._bytes = 0
+        self._trava = threading.Lock()
+        self.acertos = 0
+        self.falhas = 0
+        self.invalidacoes = 0
+        self.recargas_versoes = 0
+
+    # Versão conhecida da tabela, ou None se precisar ser lida do banco
+    def versao(self, tabela):
+        return self._versoes.get(tabela)
+
+    # Contador de invalidações de cada tabela; deve ser obtido antes de ler
+    # as versões do banco e repassado a atualizar_versoes
+    def geracoes(self):
+        with self._trava:
+            return dict(self._geracoes)
+
+    # Recebe as versões lidas do banco e descarta as entradas das tabelas
+    # cuja versão mudou. Uma tabela invalidada depois de "geracoes" ter sido
+    # obtido fica sem versão: o valor lido pode ser anterior ao commit que a
+    # invalidou, e será relido do banco na próxima consulta.
+    def atualizar_versoes(self, versoes, geracoes):
+        with self._trava:
+            self.recargas_versoes += 1
+            versoes = {
+                tabela: versao for tabela, versao in versoes.items()
+                if self._geracoes.get(tabela, 0) == geracoes.get(tabela, 0)
+            }
+            for tabela in list(self._por_tabela):
+                if versoes.get(tabela) != self._versoes.get(tabela):
+                    self._remover_tabela(tabela)
+            self._versoes = versoes
+
+    # Chamada depois do commit de uma escrita feita por este processo
+    def invalidar_tabela(self, tabela):
+        with self._trava:
+            self.invalidacoes += 1
+            self._geracoes[tabela] = self._geracoes.get(tabela, 0) + 1
+            self._versoes.pop(tabela, None)
+            self._remover_tabela(tabela)
+
+    def _remover_tabela(self, tabela):
+        for chave in self._por_tabela.pop(tabela, ()):
+            _, corpo = self._entradas.pop(chave)
+            self._bytes -= len(corpo)
+
+    def obter(self, tabela, chave, versao):
+        with self._trava:
+            entrada = self._entradas.get((tabela, chave))
+            if entrada is None or entrada[0] != versao:
+                self.falhas += 1
+                return None
+            self._entradas.move_to_end((tabela, chave))
+            self.acertos += 1
+            return entrada[1]
+
+    def guardar(self, tabela, chave, versao, corpo):
+        # Respostas muito grandes expulsariam todo o resto do cache
+        if len(corpo) > self.limite_bytes // 4:
+            return
+        with self._trava:
+            # Não guarda resultados de uma versão que já foi substituída
+            if self._versoes.get(tabela) != versao:
+                return
+            anterior = self._entradas.pop((tabela, chave), None)
+            if anterior is not None:
+                self._bytes -= len(anterior[1])
+            self._entradas[(tabela, chave)] = (versao, corpo)
+            self._por_tabela.setdefault(tabela, set()).add((tabela, chave))
+            self._bytes += len(corpo)
+            while self._bytes > self.limite_bytes:
+                (tabela_antiga, chave_antiga), (_, removido) = self._entradas.popitem(last=False)
+                self._por_tabela[tabela_antiga].discard((tabela_antiga, chave_antiga))
+                self._bytes -= len(removido)
+
+    def estatisticas(self):
+        with self._trava:
+            total = self.acertos + self.falhas
+            return {
+                'entradas': len(self._entradas),
+                'bytes': self._bytes,
+                'limite_bytes': self.limite_bytes,
+                'acertos': self.acertos,
+                'falhas': self.falhas,
+                'taxa_acerto': round(self.acertos / total, 4) if total else None,
+                'invalidacoes': self.invalidacoes,
+                'recargas_versoes': self.recargas_versoes
+            }
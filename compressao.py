@@ -0,0 +1,63 @@
+import gzip
+import threading
+from collections import OrderedDict
+
+# brotli é opcional: sem ele, apenas gzip é oferecido
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+def codificacoes_disponiveis():
+    return ['br', 'gzip'] if brotli is not None else ['gzip']
+
+def comprimir(corpo, codificacao, nivel_gzip=6, qualidade_brotli=5):
+    if codificacao == 'br':
+        return brotli.compress(corpo, quality=qualidade_brotli)
+    return gzip.compress(corpo, compresslevel=nivel_gzip, mtime=0)
+
+# Cache LRU dos corpos já comprimidos, limitado pelo total de bytes. A chave
+# inclui o ETag, que muda sempre que a tabela é alterada, então uma entrada
+# nunca fica desatualizada: snapshots antigos apenas deixam de ser usados e
+# saem pelo LRU.
+class CacheCompressao:
+    def __init__(self, limite_bytes):
+        self.limite_bytes = limite_bytes
+        self._entradas = OrderedDict()
+        self._bytes = 0
+        self._trava = threading.Lock()
+        self.acertos = 0
+        self.falhas = 0
+
+    def obter(self, chave):
+        with self._trava:
+            corpo = self._entradas.get(chave)
+            if corpo is None:
+                self.falhas += 1
+                return None
+            self._entradas.move_to_end(chave)
+            self.acertos += 1
+            return corpo
+
+    def guardar(self, chave, corpo):
+        if len(corpo) > self.limite_bytes:
+            return
+        with self._trava:
+            anterior = self._entradas.pop(chave, None)
+            if anterior is not None:
+                self._bytes -= len(anterior)
+            self._entradas[chave] = corpo
+            self._bytes += len(corpo)
+            while self._bytes > self.limite_bytes:
+                _, removido = self._entradas.popitem(last=False)
+                self._bytes -= len(removido)
+
+    def estatisticas(self):
+        with self._trava:
+            return {
+                'entradas': len(self._entradas),
+                'bytes': self._bytes,
+                'limite_bytes': self.limite_bytes,
+                'acertos': self.acertos,
+                'falhas': self.falhas
+            }
@@ -2,6 +2,8 @@ import sqlite3
 import json
 import os
 
+from migracoes import aplicar_migracoes
+
 # Configuração do banco de dados
 DATABASE_URL = os.environ.get('DATABASE_URL', 'C:\\sqlite\\meu_banco.db')
 
@@ -15,24 +17,13 @@ def criar_e_popular_tabela_churches():
     conn = sqlite3.connect(DATABASE_URL)
     cursor = conn.cursor()
     
-    # Criar tabela churches se não existir
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS churches (
-        id TEXT PRIMARY KEY,
-        nome TEXT,
-        morada TEXT,
-        ano TEXT,
-        agendamento TEXT,
-        autorizadoFilippi TEXT,
-        arquivada INTEGER DEFAULT 0,
-        dados TEXT
-    )
-    ''')
-    
-    print("Tabela 'churches' verificada/criada.")
+    # Criar tabela churches se não existir (migrações pendentes do esquema)
+    aplicadas = aplicar_migracoes(conn)
+    print(f"Tabela 'churches' verificada/criada. Migrações aplicadas: {aplicadas or 'nenhuma'}")
     
-    # Verificar se há registros na tabela
-    cursor.execute("SELECT COUNT(*) FROM churches")
+    # Verificar se há registros na tabela, além do exemplo que as migrações
+    # inserem em um banco novo
+    cursor.execute("SELECT COUNT(*) FROM churches WHERE id != 'demo1'")
     count = cursor.fetchone()[0]
     print(f"Registros encontrados: {count}")
     
@@ -65,7 +56,7 @@ def criar_e_popular_tabela_churches():
         
         for exemplo in exemplos:
             cursor.execute('''
-            INSERT INTO churches (id, nome, morada, ano, agendamento, autorizadoFilippi, arquivada, dados)
+            INSERT OR REPLACE INTO churches (id, nome, morada, ano, agendamento, autorizadoFilippi, arquivada, dados)
             VALUES (?, ?, ?, ?, ?, ?, ?, ?)
             ''', (
                 exemplo['id'],
@@ -3,6 +3,8 @@ import os
 import json
 from datetime import datetime
 
+from migracoes import aplicar_migracoes
+
 # Configuração do banco de dados
 DATABASE_URL = os.environ.get('DATABASE_URL', 'C:\\sqlite\\meu_banco.db')
 
@@ -33,19 +35,10 @@ def criar_tabela_churches():
         cursor.execute("DROP TABLE churches")
         print("Tabela anterior excluída.")
     
-    # Criar a tabela
-    cursor.execute("""
-    CREATE TABLE churches (
-        id TEXT PRIMARY KEY,
-        nome TEXT,
-        morada TEXT,
-        ano TEXT,
-        autorizadoFilippi TEXT,
-        agendamento TEXT,
-        arquivada INTEGER DEFAULT 0,
-        dados_extras TEXT
-    )
-    """)
+    # Criar a tabela pelo mesmo esquema usado pelo servidor. Os passos são
+    # reaplicados porque a tabela pode ter acabado de ser excluída
+    conn.commit()
+    aplicar_migracoes(conn, reaplicar=True)
     
     # Criar alguns registros de exemplo
     igrejas_exemplo = [
@@ -57,7 +50,7 @@ def criar_tabela_churches():
             "autorizadoFilippi": "Sim",
             "agendamento": "2023-12-15",
             "arquivada": 0,
-            "dados_extras": json.dumps({
+            "dados": json.dumps({
                 "telefone": "123456789",
                 "email": "igreja1@exemplo.com",
                 "responsavel": "João Silva"
@@ -71,7 +64,7 @@ def criar_tabela_churches():
             "autorizadoFilippi": "Não",
             "agendamento": "2023-11-20",
             "arquivada": 0,
-            "dados_extras": json.dumps({
+            "dados": json.dumps({
                 "telefone": "987654321",
                 "email": "igreja2@exemplo.com",
                 "responsavel": "Maria Santos"
@@ -85,7 +78,7 @@ def criar_tabela_churches():
             "autorizadoFilippi": "Sim",
             "agendamento": "2022-10-05",
             "arquivada": 1,
-            "dados_extras": json.dumps({
+            "dados": json.dumps({
                 "telefone": "555666777",
                 "email": "igreja3@exemplo.com",
                 "responsavel": "Pedro Oliveira",
@@ -94,10 +87,10 @@ def criar_tabela_churches():
         }
     ]
     
-    # Inserir registros de exemplo
+    # Inserir registros de exemplo (substituindo o que as migrações inserem)
     for igreja in igrejas_exemplo:
         cursor.execute("""
-        INSERT INTO churches (id, nome, morada, ano, autorizadoFilippi, agendamento, arquivada, dados_extras)
+        INSERT OR REPLACE INTO churches (id, nome, morada, ano, autorizadoFilippi, agendamento, arquivada, dados)
         VALUES (?, ?, ?, ?, ?, ?, ?, ?)
         """, (
             igreja["id"],
@@ -107,7 +100,7 @@ def criar_tabela_churches():
             igreja["autorizadoFilippi"],
             igreja["agendamento"],
             igreja["arquivada"],
-            igreja["dados_extras"]
+            igreja["dados"]
         ))
     
     # Commit e fechar conexão
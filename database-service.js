@@ -89,14 +89,15 @@ class DatabaseService {
         const timestamp = Date.now();
         const endpoint = `/churches?t=${timestamp}`;
 
-        // 1. Tentar conexão direta
+        // 1. Tentar conexão direta (sem timestamp: o navegador revalida com o
+        // ETag e o servidor responde 304 quando a tabela não mudou)
         try {
-            console.log(`Tentando conexão direta com ${this.serverUrl}${endpoint}`);
-            const response = await fetch(`${this.serverUrl}${endpoint}`, {
+            console.log(`Tentando conexão direta com ${this.serverUrl}/churches`);
+            const response = await fetch(`${this.serverUrl}/churches`, {
                 method: 'GET',
+                cache: 'no-cache',
                 headers: {
-                    'Accept': 'application/json',
-                    'Cache-Control': 'no-cache'
+                    'Accept': 'application/json'
                 }
             });
 
@@ -364,6 +365,37 @@ class DatabaseService {
         }
     }
 
+    // Assina as alterações de uma tabela por Server-Sent Events (/_eventos).
+    // onChange recebe { tipo, seq, tabela, id, operacao } a cada alteração;
+    // tipo 'tabela' ou 'recarregar' indica que a tabela inteira deve ser relida.
+    // O EventSource reconecta sozinho e retoma do último evento recebido.
+    // Devolve o EventSource (chame close() para cancelar) ou null se o navegador
+    // não suportar, caso em que quem chamou continua com a atualização manual.
+    subscribeToChanges(table, onChange) {
+        if (typeof EventSource === 'undefined') {
+            console.warn('EventSource não suportado; atualizações automáticas desativadas');
+            return null;
+        }
+
+        const url = `${this.serverUrl}/_eventos${table ? `?tabela=${encodeURIComponent(table)}` : ''}`;
+        const source = new EventSource(url);
+
+        const handle = (tipo) => (event) => {
+            try {
+                const data = JSON.parse(event.data);
+                onChange({ tipo, ...data });
+            } catch (error) {
+                console.error('Evento de alteração inválido:', error);
+            }
+        };
+        source.addEventListener('alteracao', handle('alteracao'));
+        source.addEventListener('tabela', handle('tabela'));
+        source.addEventListener('recarregar', handle('recarregar'));
+        source.onerror = () => console.warn('Conexão de eventos interrompida; o navegador vai reconectar');
+
+        return source;
+    }
+
     // Lista todas as tabelas disponíveis no servidor
     async listTables() {
         try {
@@ -0,0 +1,122 @@
+import cProfile
+import itertools
+import pstats
+import sqlite3
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+# Ferramentas de diagnóstico em produção: registro das consultas lentas (com o
+# plano do SQLite) e perfil cProfile de requisições escolhidas. Os registros
+# ficam em memória, por worker, limitados aos mais recentes.
+
+COMANDOS_COM_PLANO = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+def _agora():
+    return datetime.now(timezone.utc).isoformat(timespec='milliseconds')
+
+# Plano de execução do comando, lido com um cursor comum para não entrar na medição
+def explicar(conn, sql, parametros):
+    if not sql.lstrip().upper().startswith(COMANDOS_COM_PLANO) or parametros is None:
+        return None
+    try:
+        cursor = sqlite3.Cursor(conn)
+        return [row[3] for row in cursor.execute(f"EXPLAIN QUERY PLAN {sql}", parametros).fetchall()]
+    except sqlite3.Error:
+        return None
+
+class RegistroConsultasLentas:
+    def __init__(self, limite_ms, maximo=100):
+        # limite_ms <= 0 desativa o registro
+        self.ativo = limite_ms > 0
+        self.limite = limite_ms / 1000
+        self.limite_ms = limite_ms
+        self._registros = deque(maxlen=maximo)
+        self._trava = threading.Lock()
+        self.total = 0
+
+    # Chamado quando o tempo de um comando (execute mais os fetch seguintes)
+    # passa do limite. Devolve o registro, que continua sendo atualizado
+    # enquanto o cursor for lido.
+    def registrar(self, conn, sql, parametros, segundos, rota):
+        registro = {
+            'sql': ' '.join(sql.split()),
+            'duracao_ms': round(segundos * 1000, 3),
+            'rota': rota,
+            'quando': _agora(),
+            'plano': explicar(conn, sql, parametros)
+        }
+        with self._trava:
+            self._registros.append(registro)
+            self.total += 1
+        print(f"Consulta lenta ({registro['duracao_ms']} ms) em {rota}: {registro['sql']}")
+        return registro
+
+    def atualizar(self, registro, segundos):
+        registro['duracao_ms'] = round(segundos * 1000, 3)
+
+    def listar(self):
+        with self._trava:
+            return list(reversed(self._registros))
+
+class PerfisRequisicao:
+    def __init__(self, maximo=20, frames=30):
+        self.frames = frames
+        self._perfis = deque(maxlen=maximo)
+        self._ids = itertools.count(1)
+        # O cProfile mede uma requisição por vez
+        self._em_uso = threading.Lock()
+        self._trava = threading.Lock()
+
+    # Devolve um perfil já ativo, ou None se outro perfil estiver em andamento
+    def iniciar(self):
+        if not self._em_uso.acquire(blocking=False):
+            return None
+        perfil = cProfile.Profile()
+        perfil.inicio = time.perf_counter()
+        perfil.enable()
+        return perfil
+
+    # Para o perfil, guarda as funções mais caras (por tempo acumulado) e
+    # devolve o id do registro
+    def finalizar(self, perfil, metodo, url):
+        perfil.disable()
+        duracao = time.perf_counter() - perfil.inicio
+        self._em_uso.release()
+
+        estatisticas = pstats.Stats(perfil).stats
+        funcoes = sorted(estatisticas.items(), key=lambda item: item[1][3], reverse=True)[:self.frames]
+        registro = {
+            'id': next(self._ids),
+            'metodo': metodo,
+            'url': url,
+            'quando': _agora(),
+            'duracao_ms': round(duracao * 1000, 3),
+            'funcoes': [
+                {
+                    'funcao': f'{arquivo}:{linha}({nome})',
+                    'chamadas': chamadas,
+                    'tempo_proprio_ms': round(proprio * 1000, 3),
+                    'tempo_acumulado_ms': round(acumulado * 1000, 3)
+                }
+                for (arquivo, linha, nome), (_, chamadas, proprio, acumulado, _) in funcoes
+            ]
+        }
+        with self._trava:
+            self._perfis.append(registro)
+        return registro['id']
+
+    def listar(self):
+        with self._trava:
+            return [
+                {chave: valor for chave, valor in perfil.items() if chave != 'funcoes'}
+                for perfil in reversed(self._perfis)
+            ]
+
+    def obter(self, id_perfil):
+        with self._trava:
+            for perfil in self._perfis:
+                if perfil['id'] == id_perfil:
+                    return perfil
+        return None
@@ -0,0 +1,127 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+# Escrita agrupada (group commit). As escritas de todas as threads do worker
+# entram em uma fila atendida por uma única thread escritora, que junta os
+# pedidos chegados dentro de uma janela curta em uma só transação. Cada pedido
+# roda em um SAVEPOINT próprio, então o erro de um não desfaz os outros. Só
+# depois do COMMIT cada requisição recebe a resposta: a durabilidade é a mesma
+# de um commit por escrita, mas o custo do commit é dividido pelo lote. Com WAL
+# e synchronous=NORMAL (o padrão do pool) o COMMIT não faz fsync, e os últimos
+# lotes confirmados podem se perder numa queda de energia; DB_SYNCHRONOUS=FULL
+# faz cada lote esperar o fsync antes de responder.
+
+class Pedido:
+    __slots__ = ('funcao', 'pronto', 'resultado', 'erro')
+
+    def __init__(self, funcao):
+        self.funcao = funcao
+        self.pronto = threading.Event()
+        self.resultado = None
+        self.erro = None
+
+class EscritorAgrupado:
+    # executar_transacao(conn, funcao) abre a transação de escrita, chama a
+    # função e faz o commit (ver TravaEscrita.executar)
+    def __init__(self, obter_conexao, executar_transacao, janela_ms=2, maximo_lote=256):
+        self.obter_conexao = obter_conexao
+        self.executar_transacao = executar_transacao
+        self.janela = janela_ms / 1000
+        self.maximo_lote = max(1, maximo_lote)
+        self._fila = queue.Queue()
+        self._trava = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self.lotes = 0
+        self.pedidos = 0
+        self.maior_lote = 0
+        self.falhas_commit = 0
+
+    # Executa funcao(conn) dentro da transação do próximo lote e devolve o
+    # resultado depois do commit. Exceções da função são relançadas aqui.
+    def executar(self, funcao):
+        self._garantir_thread()
+        pedido = Pedido(funcao)
+        self._fila.put(pedido)
+        pedido.pronto.wait()
+        if pedido.erro is not None:
+            raise pedido.erro
+        return pedido.resultado
+
+    def _garantir_thread(self):
+        # A thread é criada no próprio processo do worker (depois do fork)
+        if self._pid == os.getpid() and self._thread is not None:
+            return
+        with self._trava:
+            if self._pid != os.getpid() or self._thread is None:
+                self._fila = queue.Queue()
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._executar, name='escrita-agrupada', daemon=True)
+                self._thread.start()
+
+    def _proximo_lote(self):
+        lote = [self._fila.get()]
+        limite = time.monotonic() + self.janela
+        while len(lote) < self.maximo_lote:
+            restante = limite - time.monotonic()
+            try:
+                lote.append(self._fila.get(timeout=restante) if restante > 0 else self._fila.get_nowait())
+            except queue.Empty:
+                break
+        return lote
+
+    def _executar(self):
+        while True:
+            lote = self._proximo_lote()
+            try:
+                conn = self.obter_conexao()
+            except Exception as e:
+                for pedido in lote:
+                    pedido.erro = e
+                    pedido.pronto.set()
+                continue
+            try:
+                self._gravar_lote(conn, lote)
+            finally:
+                conn.close()
+                for pedido in lote:
+                    pedido.pronto.set()
+
+    def _aplicar_lote(self, conn, lote):
+        for pedido in lote:
+            conn.execute("SAVEPOINT pedido")
+            try:
+                pedido.resultado = pedido.funcao(conn)
+                conn.execute("RELEASE pedido")
+            except Exception as e:
+                conn.execute("ROLLBACK TO pedido")
+                conn.execute("RELEASE pedido")
+                pedido.erro = e
+
+    def _gravar_lote(self, conn, lote):
+        try:
+            self.executar_transacao(conn, lambda conn: self._aplicar_lote(conn, lote))
+        except sqlite3.Error as e:
+            # Sem commit nenhum pedido do lote foi gravado
+            self.falhas_commit += 1
+            for pedido in lote:
+                if pedido.erro is None:
+                    pedido.resultado = None
+                    pedido.erro = e
+        self.lotes += 1
+        self.pedidos += len(lote)
+        self.maior_lote = max(self.maior_lote, len(lote))
+
+    def estatisticas(self):
+        return {
+            'lotes': self.lotes,
+            'pedidos': self.pedidos,
+            'media_por_lote': round(self.pedidos / self.lotes, 2) if self.lotes else None,
+            'maior_lote': self.maior_lote,
+            'falhas_commit': self.falhas_commit,
+            'na_fila': self._fila.qsize(),
+            'janela_ms': self.janela * 1000
+        }
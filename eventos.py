@@ -0,0 +1,162 @@
+import itertools
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from alteracoes import horizonte, ultimo_seq
+
+# Notificação de alterações por Server-Sent Events. Uma thread por worker
+# acompanha o PRAGMA data_version de uma conexão própria, que muda quando
+# qualquer outra conexão (deste ou de outro processo) faz commit. Só então ela
+# lê as entradas novas do _changelog, uma vez, e entrega o texto dos eventos a
+# todos os assinantes. Com o banco parado o custo é um PRAGMA por intervalo,
+# qualquer que seja o número de clientes conectados.
+
+def formatar_evento(nome, dados, id_evento=None):
+    linhas = [] if id_evento is None else [f'id: {id_evento}']
+    linhas.append(f'event: {nome}')
+    linhas.append(f"data: {json.dumps(dados, ensure_ascii=False, separators=(',', ':'))}")
+    return '\n'.join(linhas) + '\n\n'
+
+# Eventos com seq em (desde, ate], como uma lista de (tabela, texto), e o seq
+# até onde foram lidos. Até "maximo" alterações viram um evento "alteracao"
+# cada; acima disso (uma escrita em lote, por exemplo) vai um evento "tabela"
+# por tabela, e o cliente recarrega a tabela inteira. Um "desde" anterior ao
+# horizonte da compactação vira um único evento "recarregar".
+def eventos_desde(conn, desde, maximo, ate=None):
+    if ate is None:
+        ate = ultimo_seq(conn)
+    if desde >= ate:
+        return [], desde
+    if desde < horizonte(conn):
+        return [(None, formatar_evento('recarregar', {'seq': ate}, ate))], ate
+
+    linhas = conn.execute(
+        "SELECT seq, tabela, id, operacao FROM _changelog WHERE seq > ? AND seq <= ? ORDER BY seq LIMIT ?",
+        (desde, ate, maximo + 1)
+    ).fetchall()
+    if len(linhas) <= maximo:
+        return [
+            (tabela, formatar_evento('alteracao', {'seq': seq, 'tabela': tabela, 'id': id_registro, 'operacao': operacao}, seq))
+            for seq, tabela, id_registro, operacao in linhas
+        ], ate
+
+    grupos = conn.execute(
+        "SELECT tabela, COUNT(*), MAX(seq) FROM _changelog WHERE seq > ? AND seq <= ? "
+        "GROUP BY tabela ORDER BY MAX(seq)",
+        (desde, ate)
+    ).fetchall()
+    # O último evento leva o id "ate", para o cliente retomar dali
+    return [
+        (tabela, formatar_evento('tabela', {'seq': seq, 'tabela': tabela, 'alteracoes': total},
+                                 ate if indice == len(grupos) - 1 else seq))
+        for indice, (tabela, total, seq) in enumerate(grupos)
+    ], ate
+
+def filtrar(eventos, tabela):
+    return [texto for tabela_evento, texto in eventos if tabela is None or tabela_evento in (None, tabela)]
+
+class NotificadorAlteracoes:
+    def __init__(self, abrir_conexao, intervalo_ms=250, maximo_eventos=100):
+        self.abrir_conexao = abrir_conexao
+        self.intervalo = intervalo_ms / 1000
+        self.maximo_eventos = maximo_eventos
+        self._assinantes = {}
+        self._ids = itertools.count(1)
+        self._trava = threading.Lock()
+        self._acordar = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._conn = None
+        # Seq até onde os eventos já foram entregues
+        self.ultimo = 0
+        self.verificacoes = 0
+        self.leituras = 0
+        self.eventos = 0
+
+    # Registra entregar(textos), chamada pela thread do notificador com a
+    # lista de eventos já formatados. Devolve (token, ate): os eventos com seq
+    # até "ate" não serão entregues, e quem quiser retomar de um seq anterior
+    # deve lê-los com eventos_desde(conn, desde, maximo, ate).
+    def assinar(self, entregar, tabela=None):
+        self._garantir_thread()
+        with self._trava:
+            # Sem assinantes a thread não acompanha o registro: a posição é
+            # atualizada aqui, senão o novo assinante receberia como novas as
+            # alterações feitas enquanto ela dormia
+            if not self._assinantes:
+                self.ultimo = ultimo_seq(self._conn)
+            token = next(self._ids)
+            self._assinantes[token] = (entregar, tabela)
+            ate = self.ultimo
+        self._acordar.set()
+        return token, ate
+
+    def cancelar(self, token):
+        with self._trava:
+            self._assinantes.pop(token, None)
+
+    def _garantir_thread(self):
+        # A thread (e a conexão) são criadas no próprio processo do worker
+        if self._pid == os.getpid() and self._thread is not None:
+            return
+        with self._trava:
+            if self._pid == os.getpid() and self._thread is not None:
+                return
+            self._conn = self.abrir_conexao()
+            self.ultimo = ultimo_seq(self._conn)
+            self._assinantes = {}
+            self._acordar = threading.Event()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._executar, name='eventos', daemon=True)
+            self._thread.start()
+
+    def _executar(self):
+        visto = None
+        while True:
+            # Sem assinantes a thread dorme até o próximo
+            if not self._assinantes:
+                self._acordar.wait()
+                self._acordar.clear()
+                continue
+            time.sleep(self.intervalo)
+            try:
+                versao = self._conn.execute("PRAGMA data_version").fetchone()[0]
+                self.verificacoes += 1
+                if versao == visto:
+                    continue
+                visto = versao
+                self.leituras += 1
+                desde = self.ultimo
+                eventos, ate = eventos_desde(self._conn, desde, self.maximo_eventos)
+            except sqlite3.Error as e:
+                print(f"ERRO ao ler o registro de alterações: {str(e)}")
+                continue
+            # Quem assinar depois deste ponto recebe "ate" como início
+            with self._trava:
+                if self.ultimo != desde:
+                    # A posição foi atualizada por assinar() durante a leitura:
+                    # lê de novo a partir dela
+                    visto = None
+                    continue
+                self.ultimo = ate
+                assinantes = list(self._assinantes.values())
+            if not eventos:
+                continue
+            self.eventos += len(eventos)
+            for entregar, tabela in assinantes:
+                textos = filtrar(eventos, tabela)
+                if textos:
+                    entregar(textos)
+
+    def estatisticas(self):
+        return {
+            'assinantes': len(self._assinantes),
+            'ultimo_seq': self.ultimo,
+            'verificacoes': self.verificacoes,
+            'leituras': self.leituras,
+            'eventos': self.eventos,
+            'intervalo_ms': self.intervalo * 1000
+        }
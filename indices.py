@@ -0,0 +1,116 @@
+import threading
+from collections import Counter
+from datetime import datetime, timezone
+
+# Registro das colunas usadas em filtros e ordenações de cada tabela.
+# Os contadores ficam em memória, um conjunto por worker do gunicorn.
+class ObservadorConsultas:
+    def __init__(self):
+        self._filtros = Counter()
+        self._ordens = Counter()
+        self._trava = threading.Lock()
+
+    def registrar(self, tabela, colunas_filtro=(), colunas_ordem=()):
+        with self._trava:
+            for coluna in colunas_filtro:
+                self._filtros[(tabela, coluna)] += 1
+            for coluna in colunas_ordem:
+                self._ordens[(tabela, coluna)] += 1
+
+    def contagens(self):
+        with self._trava:
+            return dict(self._filtros), dict(self._ordens)
+
+# Colunas que já são a primeira coluna de algum índice da tabela
+def colunas_indexadas(conn, tabela):
+    colunas = set()
+    for indice in conn.execute(f'PRAGMA index_list("{tabela}")').fetchall():
+        info = conn.execute(f'PRAGMA index_info("{indice[1]}")').fetchall()
+        if info:
+            colunas.add(info[0][2])
+    return colunas
+
+def plano_consulta(conn, sql):
+    return [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}").fetchall()]
+
+# Sugestões de índice para as colunas observadas, com a economia estimada de
+# linhas lidas. Sem índice, um filtro por igualdade percorre as N linhas da
+# tabela; com índice lê em média N / valores_distintos. Uma ordenação sem
+# índice precisa ordenar as N linhas em uma B-tree temporária.
+def sugerir_indices(conn, observador, minimo_consultas=1):
+    filtros, ordens = observador.contagens()
+    sugestoes = []
+    totais_tabela = {}
+
+    for (tabela, coluna) in sorted(set(filtros) | set(ordens)):
+        if coluna == 'id':
+            continue
+        existe = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (tabela,)
+        ).fetchone()
+        if not existe or coluna in colunas_indexadas(conn, tabela):
+            continue
+
+        consultas_filtro = filtros.get((tabela, coluna), 0)
+        consultas_ordem = ordens.get((tabela, coluna), 0)
+        if consultas_filtro + consultas_ordem < minimo_consultas:
+            continue
+
+        if tabela not in totais_tabela:
+            totais_tabela[tabela] = conn.execute(f'SELECT COUNT(*) FROM "{tabela}"').fetchone()[0]
+        total = totais_tabela[tabela]
+        distintos = conn.execute(f'SELECT COUNT(DISTINCT "{coluna}") FROM "{tabela}"').fetchone()[0]
+
+        plano_filtro = plano_consulta(conn, f'SELECT * FROM "{tabela}" WHERE "{coluna}" = \'\'')
+        plano_ordem = plano_consulta(conn, f'SELECT * FROM "{tabela}" ORDER BY "{coluna}"')
+        faz_scan = any(passo.startswith('SCAN') for passo in plano_filtro)
+        ordena_em_memoria = any('TEMP B-TREE' in passo for passo in plano_ordem)
+
+        linhas_por_filtro = total - (total / distintos if distintos else 0) if faz_scan else 0
+        linhas_por_ordem = total if ordena_em_memoria else 0
+        economia = consultas_filtro * linhas_por_filtro + consultas_ordem * linhas_por_ordem
+        if economia <= 0:
+            continue
+
+        sugestoes.append({
+            'tabela': tabela,
+            'coluna': coluna,
+            'nome_indice': f'idx_auto_{tabela}_{coluna}',
+            'sql': f'CREATE INDEX IF NOT EXISTS "idx_auto_{tabela}_{coluna}" ON "{tabela}" ("{coluna}")',
+            'consultas_filtro': consultas_filtro,
+            'consultas_ordem': consultas_ordem,
+            'linhas_tabela': total,
+            'valores_distintos': distintos,
+            'plano_atual': plano_filtro + plano_ordem,
+            'linhas_poupadas_por_filtro': round(linhas_por_filtro),
+            'linhas_poupadas_estimadas': round(economia)
+        })
+
+    sugestoes.sort(key=lambda sugestao: sugestao['linhas_poupadas_estimadas'], reverse=True)
+    return sugestoes
+
+def criar_indices(conn, sugestoes):
+    criados = []
+    for sugestao in sugestoes:
+        conn.execute(sugestao['sql'])
+        criados.append(sugestao['nome_indice'])
+    conn.commit()
+    # Atualiza as estatísticas usadas pelo planejador do SQLite
+    if criados:
+        conn.execute("PRAGMA optimize")
+    return criados
+
+# Verifica se o horário atual (UTC) está na janela "HH:MM-HH:MM".
+# A janela pode atravessar a meia-noite (ex.: "23:00-02:00").
+def dentro_da_janela(janela, agora=None):
+    if not janela:
+        return False
+    agora = agora or datetime.now(timezone.utc)
+    inicio, fim = [
+        int(parte.split(':')[0]) * 60 + int(parte.split(':')[1])
+        for parte in janela.split('-')
+    ]
+    minuto = agora.hour * 60 + agora.minute
+    if inicio <= fim:
+        return inicio <= minuto < fim
+    return minuto >= inicio or minuto < fim
@@ -0,0 +1,121 @@
+import threading
+from bisect import bisect_left
+
+# Métricas do servidor no formato texto do Prometheus. Cada worker do gunicorn
+# tem as suas: os contadores ficam em memória e são zerados quando o worker
+# reinicia. A coleta por requisição é só somar em dicionários sob uma trava.
+
+# Limites (em segundos) dos histogramas de tempo
+LIMITES_SEGUNDOS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class Histograma:
+    def __init__(self, limites=LIMITES_SEGUNDOS):
+        self.limites = limites
+        # Contagem por faixa (não acumulada); a última é a faixa +Inf
+        self.faixas = [0] * (len(limites) + 1)
+        self.soma = 0.0
+        self.total = 0
+
+    def observar(self, valor):
+        self.faixas[bisect_left(self.limites, valor)] += 1
+        self.soma += valor
+        self.total += 1
+
+    def linhas(self, nome, rotulos):
+        acumulado = 0
+        for limite, quantidade in zip(self.limites + ('+Inf',), self.faixas):
+            acumulado += quantidade
+            yield f'{nome}_bucket{_rotulos(rotulos, le=limite)} {acumulado}'
+        yield f'{nome}_sum{_rotulos(rotulos)} {self.soma:.6f}'
+        yield f'{nome}_count{_rotulos(rotulos)} {self.total}'
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _rotulos(rotulos, **extras):
+    pares = list(rotulos) + list(extras.items())
+    if not pares:
+        return ''
+    return '{' + ','.join(f'{nome}="{_escapar(valor)}"' for nome, valor in pares) + '}'
+
+class Metricas:
+    def __init__(self):
+        self._trava = threading.Lock()
+        self._local = threading.local()
+        self._requisicoes = {}
+        self._erros = {}
+        self._bytes = {}
+        self._latencia = {}
+        self._sqlite = {}
+        self._serializacao = {}
+        self.em_andamento = 0
+
+    # Tempos gastos pela requisição atual, acumulados na thread que a atende
+    def iniciar_requisicao(self):
+        self._local.sqlite = 0.0
+        self._local.serializacao = 0.0
+        with self._trava:
+            self.em_andamento += 1
+
+    def somar_sqlite(self, segundos):
+        self._local.sqlite = getattr(self._local, 'sqlite', 0.0) + segundos
+
+    def somar_serializacao(self, segundos):
+        self._local.serializacao = getattr(self._local, 'serializacao', 0.0) + segundos
+
+    def registrar_resposta(self, metodo, rota, status, duracao, tamanho):
+        sqlite = getattr(self._local, 'sqlite', 0.0)
+        serializacao = getattr(self._local, 'serializacao', 0.0)
+        chave = (('rota', rota),)
+        with self._trava:
+            contador = (('metodo', metodo), ('rota', rota), ('status', status))
+            self._requisicoes[contador] = self._requisicoes.get(contador, 0) + 1
+            if status >= 500:
+                self._erros[chave] = self._erros.get(chave, 0) + 1
+            if tamanho:
+                self._bytes[chave] = self._bytes.get(chave, 0) + tamanho
+            for histogramas, valor in (
+                (self._latencia, duracao),
+                (self._sqlite, sqlite),
+                (self._serializacao, serializacao)
+            ):
+                histograma = histogramas.get(chave)
+                if histograma is None:
+                    histograma = histogramas[chave] = Histograma()
+                histograma.observar(valor)
+
+    def finalizar_requisicao(self):
+        with self._trava:
+            self.em_andamento -= 1
+
+    # Texto no formato de exposição do Prometheus. "extras" recebe valores de
+    # outras partes do servidor como (nome, tipo, ajuda, valor)
+    def formatar(self, extras=()):
+        linhas = []
+        def contador(nome, ajuda, valores):
+            linhas.append(f'# HELP {nome} {ajuda}')
+            linhas.append(f'# TYPE {nome} counter')
+            for rotulos, valor in sorted(valores.items()):
+                linhas.append(f'{nome}{_rotulos(rotulos)} {valor}')
+        def histogramas(nome, ajuda, valores):
+            linhas.append(f'# HELP {nome} {ajuda}')
+            linhas.append(f'# TYPE {nome} histogram')
+            for rotulos, histograma in sorted(valores.items()):
+                linhas.extend(histograma.linhas(nome, rotulos))
+
+        with self._trava:
+            contador('servidor_requisicoes_total', 'Requisicoes atendidas por metodo, rota e status', self._requisicoes)
+            contador('servidor_erros_total', 'Respostas com status 5xx por rota', self._erros)
+            contador('servidor_resposta_bytes_total', 'Bytes enviados no corpo das respostas por rota', self._bytes)
+            histogramas('servidor_requisicao_segundos', 'Duracao das requisicoes por rota', self._latencia)
+            histogramas('servidor_sqlite_segundos', 'Tempo gasto no SQLite por requisicao', self._sqlite)
+            histogramas('servidor_serializacao_segundos', 'Tempo gasto serializando JSON por requisicao', self._serializacao)
+            linhas.append('# HELP servidor_requisicoes_em_andamento Requisicoes sendo atendidas agora')
+            linhas.append('# TYPE servidor_requisicoes_em_andamento gauge')
+            linhas.append(f'servidor_requisicoes_em_andamento {self.em_andamento}')
+
+        for nome, tipo, ajuda, valor in extras:
+            linhas.append(f'# HELP {nome} {ajuda}')
+            linhas.append(f'# TYPE {nome} {tipo}')
+            linhas.append(f'{nome} {valor}')
+        return '\n'.join(linhas) + '\n'
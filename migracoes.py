@@ -0,0 +1,138 @@
+import json
+import random
+import sqlite3
+from datetime import datetime, timezone
+
+from alteracoes import criar_registro_alteracoes
+from busca import garantir_indice_busca
+
+# Migrações do esquema do banco, aplicadas em ordem e uma única vez. As versões
+# já aplicadas ficam em _schema_version; na inicialização basta comparar a
+# maior versão registrada com a última da lista, e só os passos pendentes rodam.
+#
+# Para mudar o esquema, acrescente um passo ao final de MIGRACOES (nunca altere
+# um passo já publicado). Prefira os auxiliares adicionar_coluna e criar_indice:
+# no SQLite, ADD COLUMN só altera o esquema, sem reescrever a tabela, e um índice
+# novo é construído sem copiar os dados. Os passos devem ser idempotentes
+# (IF NOT EXISTS), porque bancos antigos já podem ter o objeto criado à mão.
+
+def adicionar_coluna(conn, tabela, coluna, definicao):
+    colunas = [row[1] for row in conn.execute(f'PRAGMA table_info("{tabela}")').fetchall()]
+    if coluna not in colunas:
+        conn.execute(f'ALTER TABLE "{tabela}" ADD COLUMN "{coluna}" {definicao}')
+
+def criar_indice(conn, nome, tabela, colunas, unico=False):
+    lista = ', '.join(f'"{coluna}"' for coluna in colunas)
+    conn.execute(
+        f'CREATE {"UNIQUE " if unico else ""}INDEX IF NOT EXISTS "{nome}" ON "{tabela}" ({lista})'
+    )
+
+def _criar_churches(conn):
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS churches (
+        id TEXT PRIMARY KEY,
+        nome TEXT,
+        morada TEXT,
+        ano TEXT,
+        agendamento TEXT,
+        autorizadoFilippi TEXT,
+        arquivada INTEGER DEFAULT 0,
+        dados TEXT
+    )
+    ''')
+
+# Versão de cada tabela, usada pelos ETags do servidor. A linha '*' guarda um
+# número aleatório do banco, para que as versões de um banco recriado não
+# coincidam com ETags antigas dos clientes. Os gatilhos que incrementam as
+# versões são criados pelo servidor para cada tabela que encontrar.
+def _criar_versoes_tabelas(conn):
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS _versoes_tabelas (
+        tabela TEXT PRIMARY KEY,
+        versao INTEGER NOT NULL DEFAULT 0
+    )
+    ''')
+    conn.execute(
+        "INSERT OR IGNORE INTO _versoes_tabelas (tabela, versao) VALUES ('*', ?)",
+        (random.getrandbits(31),)
+    )
+
+def _criar_busca_churches(conn):
+    # Sem FTS5 no SQLite o passo não cria nada e a busca responde 501
+    garantir_indice_busca(conn, 'churches', ['nome', 'morada'])
+
+def _registro_exemplo(conn):
+    # Só em um banco novo, com a tabela churches vazia
+    conn.execute('''
+    INSERT INTO churches (id, nome, morada, ano, agendamento, autorizadoFilippi, arquivada, dados)
+    SELECT ?, ?, ?, ?, ?, ?, ?, ?
+    WHERE NOT EXISTS (SELECT 1 FROM churches)
+    ''', (
+        'demo1',
+        'Igreja Exemplo',
+        'Rua de Exemplo, 123',
+        '2023',
+        'Sim',
+        'Sim',
+        0,
+        json.dumps({"info": "Dados de exemplo para teste"})
+    ))
+
+# (versão, descrição, função que aplica o passo)
+MIGRACOES = [
+    (1, 'Cria a tabela churches', _criar_churches),
+    (2, 'Cria a tabela de versões usada pelos ETags', _criar_versoes_tabelas),
+    (3, 'Cria o índice de busca textual de churches', _criar_busca_churches),
+    (4, 'Insere o registro de exemplo em um banco novo', _registro_exemplo),
+    (5, 'Cria as tabelas do registro de alterações', criar_registro_alteracoes),
+]
+
+def versao_atual(conn):
+    try:
+        return conn.execute("SELECT MAX(versao) FROM _schema_version").fetchone()[0] or 0
+    except sqlite3.OperationalError:
+        # Banco novo, ainda sem a tabela de controle
+        return 0
+
+def versao_mais_recente():
+    return MIGRACOES[-1][0] if MIGRACOES else 0
+
+# Aplica os passos pendentes e devolve as versões aplicadas. Se a conexão já
+# estiver em uma transação, os passos entram nela e o commit fica com quem
+# chamou; senão a função abre uma transação IMMEDIATE, para que processos que
+# sobem juntos apliquem as migrações um de cada vez.
+# Com reaplicar=True todos os passos rodam de novo (ex.: depois de excluir uma tabela).
+def aplicar_migracoes(conn, reaplicar=False):
+    if not reaplicar and versao_atual(conn) >= versao_mais_recente():
+        return []
+
+    transacao_propria = not conn.in_transaction
+    if transacao_propria:
+        conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute('''
+        CREATE TABLE IF NOT EXISTS _schema_version (
+            versao INTEGER PRIMARY KEY,
+            descricao TEXT NOT NULL,
+            aplicada_em TEXT NOT NULL
+        )
+        ''')
+        # Relê a versão com a trava de escrita: outro processo pode ter migrado antes
+        atual = 0 if reaplicar else versao_atual(conn)
+        aplicadas = []
+        for versao, descricao, passo in MIGRACOES:
+            if versao <= atual:
+                continue
+            passo(conn)
+            conn.execute(
+                "INSERT OR REPLACE INTO _schema_version (versao, descricao, aplicada_em) VALUES (?, ?, ?)",
+                (versao, descricao, datetime.now(timezone.utc).isoformat(timespec='seconds'))
+            )
+            aplicadas.append(versao)
+        if transacao_propria:
+            conn.commit()
+        return aplicadas
+    except Exception:
+        if transacao_propria:
+            conn.rollback()
+        raise
@@ -0,0 +1,64 @@
+import json
+import time
+
+from flask.json.provider import DefaultJSONProvider
+
+# orjson é opcional: quando instalado, é usado para serializar as respostas
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Provedor JSON do Flask usado por jsonify, pelos tratadores de erro e pelas
+# respostas em streaming. Usa orjson quando disponível e o json da biblioteca
+# padrão como reserva. Bytes já codificados (ex.: respostas guardadas em cache)
+# passam direto, sem serializar de novo.
+class ProvedorJSONRapido(DefaultJSONProvider):
+    usar_orjson = orjson is not None
+    # Função opcional que recebe o tempo (em segundos) de cada serialização
+    medidor = None
+
+    def codificar(self, obj, ordenar_chaves=True):
+        if isinstance(obj, (bytes, bytearray, memoryview)):
+            return bytes(obj)
+        if self.medidor is None:
+            return self._codificar(obj, ordenar_chaves)
+        inicio = time.perf_counter()
+        try:
+            return self._codificar(obj, ordenar_chaves)
+        finally:
+            self.medidor(time.perf_counter() - inicio)
+
+    def _codificar(self, obj, ordenar_chaves):
+        if self.usar_orjson:
+            opcoes = orjson.OPT_NON_STR_KEYS
+            if ordenar_chaves:
+                opcoes |= orjson.OPT_SORT_KEYS
+            try:
+                return orjson.dumps(obj, default=self.default, option=opcoes)
+            except (orjson.JSONEncodeError, TypeError):
+                # Ex.: inteiros maiores que 64 bits; o json padrão resolve
+                pass
+        return json.dumps(
+            obj,
+            default=self.default,
+            ensure_ascii=self.ensure_ascii,
+            sort_keys=ordenar_chaves,
+            separators=(',', ':')
+        ).encode('utf-8')
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        if isinstance(obj, (bytes, bytearray, memoryview)):
+            corpo = bytes(obj)
+        elif (self.compact is None and self._app.debug) or self.compact is False:
+            # Em modo debug mantém a saída indentada do provedor padrão
+            corpo = f"{self.dumps(obj, indent=2)}\n".encode('utf-8')
+        else:
+            corpo = self.codificar(obj) + b'\n'
+        return self._app.response_class(corpo, mimetype=self.mimetype)
+
+    def loads(self, s, **kwargs):
+        if self.usar_orjson and not kwargs:
+            return orjson.loads(s)
+        return super().loads(s, **kwargs)
@@ -1,18 +1,50 @@
-from flask import Flask, jsonify, request, make_response, redirect
+import time
+
+# Início da importação do servidor, referência do relatório de inicialização
+INICIO_IMPORTACAO = time.perf_counter()
+
+from flask import Flask, Response, jsonify, request, make_response, redirect, g, has_request_context
 import sqlite3
 import os
 import json
+import threading
+import random
+import zlib
+from urllib.parse import urlencode
+from datetime import datetime, timezone
+import hmac
 from flask_cors import CORS
 import sys
+from indices import ObservadorConsultas, sugerir_indices, criar_indices, dentro_da_janela
+from busca import tokenizador_indice, buscar
+from serializador import ProvedorJSONRapido
+from compressao import CacheCompressao, codificacoes_disponiveis, comprimir
+from cache_leituras import CacheLeituras
+from migracoes import aplicar_migracoes, versao_atual, versao_mais_recente
+from metricas import Metricas
+from diagnostico import RegistroConsultasLentas, PerfisRequisicao
+from escrita_agrupada import EscritorAgrupado
+from transacoes import TravaEscrita, banco_travado
+from alteracoes import garantir_gatilhos_alteracoes, listar_alteracoes, compactar, horizonte, ultimo_seq
+from eventos import NotificadorAlteracoes, eventos_desde, filtrar
+from arvore_merkle import ArvoreMerkle, DIGITOS
+import queue
 
 app = Flask(__name__)
 
+# Todas as respostas JSON passam pelo serializador rápido (orjson, se instalado)
+app.json = ProvedorJSONRapido(app)
+
+# Métricas por rota expostas em /metrics
+metricas = Metricas()
+app.json.medidor = metricas.somar_serializacao
+
 # Configuração CORS para permitir acesso de qualquer origem
 CORS(app, resources={r"/*": {
     "origins": "*",
     "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-    "allow_headers": ["Content-Type", "Authorization", "Accept", "Origin", "X-Requested-With"],
-    "expose_headers": ["Content-Type", "Authorization", "Access-Control-Allow-Origin"],
+    "allow_headers": ["Content-Type", "Authorization", "Accept", "Origin", "X-Requested-With", "If-None-Match"],
+    "expose_headers": ["Content-Type", "Authorization", "Access-Control-Allow-Origin", "ETag"],
     "max_age": 86400
 }}, supports_credentials=True)
 
@@ -27,95 +59,566 @@ if not DATABASE_URL:
         DATABASE_URL = '/tmp/sqlite/meu_banco.db'
     
 print(f"Usando banco de dados em: {DATABASE_URL}")
-print(f"Python versão: {sys.version}")
-print(f"Diretório atual: {os.getcwd()}")
-print(f"Variáveis de ambiente: {os.environ.keys()}")
+
+# Configuração do pool de conexões (um pool por worker do gunicorn)
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 4))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 10))
+DB_BUSY_TIMEOUT_MS = int(os.environ.get('DB_BUSY_TIMEOUT_MS', 5000))
+DB_SYNCHRONOUS = os.environ.get('DB_SYNCHRONOUS', 'NORMAL').upper()
+if DB_SYNCHRONOUS not in ('OFF', 'NORMAL', 'FULL', 'EXTRA'):
+    DB_SYNCHRONOUS = 'NORMAL'
+
+# Limites da paginação de GET /<tabela>
+PAGINA_PADRAO = int(os.environ.get('PAGINA_PADRAO', 100))
+PAGINA_MAXIMA = int(os.environ.get('PAGINA_MAXIMA', 1000))
+
+# Registros lidos do cursor por vez nas respostas em streaming
+LOTE_STREAM = int(os.environ.get('LOTE_STREAM', 500))
+
+# Maior número de registros aceito por PUT /<tabela>
+LOTE_MAXIMO = int(os.environ.get('LOTE_MAXIMO', 5000))
+
+# Manutenção: token das rotas administrativas e sugestão/criação de índices
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN', '')
+JANELA_MANUTENCAO = os.environ.get('JANELA_MANUTENCAO', '')  # ex.: "03:00-05:00" (UTC)
+INDICE_MIN_CONSULTAS = int(os.environ.get('INDICE_MIN_CONSULTAS', 10))
+INDICES_AUTOMATICOS = os.environ.get('INDICES_AUTOMATICOS', '') == '1'
+observador_consultas = ObservadorConsultas()
+
+# Tabelas com busca textual (FTS5) e as colunas indexadas em cada uma
+TABELAS_BUSCA = {
+    'churches': ['nome', 'morada']
+}
+BUSCA_LIMITE_PADRAO = int(os.environ.get('BUSCA_LIMITE_PADRAO', 20))
+tokenizadores_busca = {}
+
+# Árvores Merkle (GET /<tabela>/_merkle): registros por folha, prefixos aceitos
+# por requisição e árvores guardadas em memória por worker
+MERKLE_FOLHA = int(os.environ.get('MERKLE_FOLHA', 32))
+MERKLE_PREFIXOS_MAXIMO = 256
+MERKLE_ARVORES_MAXIMO = 8
+
+# Compressão das respostas (gzip e, se instalado, brotli)
+COMPRESSAO_MIN_BYTES = int(os.environ.get('COMPRESSAO_MIN_BYTES', 1024))
+COMPRESSAO_NIVEL_GZIP = int(os.environ.get('COMPRESSAO_NIVEL_GZIP', 6))
+CACHE_COMPRESSAO_BYTES = int(os.environ.get('CACHE_COMPRESSAO_BYTES', 32 * 1024 * 1024))
+cache_compressao = CacheCompressao(CACHE_COMPRESSAO_BYTES)
+
+# Cache das respostas de leitura, invalidado pelas escritas
+CACHE_LEITURAS_BYTES = int(os.environ.get('CACHE_LEITURAS_BYTES', 64 * 1024 * 1024))
+cache_leituras = CacheLeituras(CACHE_LEITURAS_BYTES)
+
+# Transações de escrita: BEGIN IMMEDIATE e, se o banco continuar travado depois
+# do busy_timeout, novas tentativas com pausa exponencial e jitter
+ESCRITA_TENTATIVAS = int(os.environ.get('ESCRITA_TENTATIVAS', 3))
+ESCRITA_PAUSA_BASE_MS = float(os.environ.get('ESCRITA_PAUSA_BASE_MS', 25))
+ESCRITA_PAUSA_MAXIMA_MS = float(os.environ.get('ESCRITA_PAUSA_MAXIMA_MS', 500))
+trava_escrita = TravaEscrita(ESCRITA_TENTATIVAS, ESCRITA_PAUSA_BASE_MS, ESCRITA_PAUSA_MAXIMA_MS)
+
+# Escrita agrupada (group commit): PUT e DELETE de um registro entram em lotes
+# confirmados por um único commit. A janela é quanto o escritor espera por mais
+# pedidos depois do primeiro.
+ESCRITA_AGRUPADA = os.environ.get('ESCRITA_AGRUPADA', '') == '1'
+ESCRITA_JANELA_MS = float(os.environ.get('ESCRITA_JANELA_MS', 2))
+ESCRITA_LOTE_MAXIMO = int(os.environ.get('ESCRITA_LOTE_MAXIMO', 256))
+
+# Diagnóstico: comandos SQL acima deste tempo (ms) são registrados com o plano
+# de execução (0 desativa). Perfis cProfile são pedidos com o cabeçalho X-Perfil.
+CONSULTA_LENTA_MS = float(os.environ.get('CONSULTA_LENTA_MS', 200))
+consultas_lentas = RegistroConsultasLentas(CONSULTA_LENTA_MS)
+perfis_requisicao = PerfisRequisicao()
+
+# Registro de alterações (/_changes): intervalo entre compactações e por quanto
+# tempo as exclusões continuam visíveis para consumidores atrasados
+ALTERACOES_COMPACTAR_S = float(os.environ.get('ALTERACOES_COMPACTAR_S', 3600))
+ALTERACOES_RETENCAO_DIAS = float(os.environ.get('ALTERACOES_RETENCAO_DIAS', 30))
+
+# Eventos de alteração (/_eventos): intervalo de verificação do banco, máximo
+# de eventos individuais por leitura, intervalo dos comentários de keep-alive,
+# duração máxima de uma conexão e espera sugerida ao cliente para reconectar
+EVENTOS_INTERVALO_MS = float(os.environ.get('EVENTOS_INTERVALO_MS', 250))
+EVENTOS_MAXIMO = int(os.environ.get('EVENTOS_MAXIMO', 100))
+EVENTOS_PING_S = float(os.environ.get('EVENTOS_PING_S', 15))
+EVENTOS_DURACAO_S = float(os.environ.get('EVENTOS_DURACAO_S', 300))
+EVENTOS_RECONEXAO_MS = int(os.environ.get('EVENTOS_RECONEXAO_MS', 3000))
+
+# Cursor que soma o tempo gasto no SQLite às métricas da requisição e registra
+# os comandos que passam de CONSULTA_LENTA_MS. O tempo de um comando inclui os
+# fetch seguintes, onde um SELECT gasta a maior parte do tempo.
+class CursorMedido(sqlite3.Cursor):
+    _sql = None
+    _parametros = None
+    _rota = None
+    _tempo = 0.0
+    _registro_lento = None
+
+    def _medir(self, inicio):
+        duracao = time.perf_counter() - inicio
+        metricas.somar_sqlite(duracao)
+        if not consultas_lentas.ativo or self._sql is None:
+            return
+        self._tempo += duracao
+        if self._tempo < consultas_lentas.limite:
+            return
+        if self._registro_lento is None:
+            self._registro_lento = consultas_lentas.registrar(
+                self.connection, self._sql, self._parametros, self._tempo, self._rota
+            )
+        else:
+            consultas_lentas.atualizar(self._registro_lento, self._tempo)
+
+    def _novo_comando(self, sql, parametros):
+        self._sql = sql
+        self._parametros = parametros
+        # Guardada já aqui: em streaming os fetch acontecem fora da requisição
+        self._rota = request.path if consultas_lentas.ativo and has_request_context() else None
+        self._tempo = 0.0
+        self._registro_lento = None
+
+    def execute(self, sql, parametros=()):
+        self._novo_comando(sql, parametros)
+        inicio = time.perf_counter()
+        try:
+            return super().execute(sql, parametros)
+        finally:
+            self._medir(inicio)
+
+    def executemany(self, sql, parametros):
+        # Sem parâmetros únicos não há como pedir o plano
+        self._novo_comando(sql, None)
+        inicio = time.perf_counter()
+        try:
+            return super().executemany(sql, parametros)
+        finally:
+            self._medir(inicio)
+
+    def fetchone(self):
+        inicio = time.perf_counter()
+        try:
+            return super().fetchone()
+        finally:
+            self._medir(inicio)
+
+    def fetchmany(self, size=None):
+        inicio = time.perf_counter()
+        try:
+            return super().fetchmany(self.arraysize if size is None else size)
+        finally:
+            self._medir(inicio)
+
+    def fetchall(self):
+        inicio = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            self._medir(inicio)
+
+# Conexão SQLite que volta para o pool quando é fechada
+class ConexaoPool(sqlite3.Connection):
+    pool = None
+    no_pool = False
+    # Último PRAGMA data_version visto por esta conexão
+    data_version_visto = None
+
+    def close(self):
+        if self.pool is None:
+            super().close()
+            return
+        if has_request_context():
+            conexoes = g.get('conexoes')
+            if conexoes and self in conexoes:
+                conexoes.remove(self)
+        self.pool.devolver(self)
+
+    def fechar_definitivamente(self):
+        self.pool = None
+        super().close()
+
+    # Todas as consultas passam pelo cursor medido
+    def cursor(self, factory=CursorMedido):
+        return super().cursor(factory)
+
+    def execute(self, sql, parametros=()):
+        return self.cursor().execute(sql, parametros)
+
+    def executemany(self, sql, parametros):
+        return self.cursor().executemany(sql, parametros)
+
+# Pool de conexões reaproveitadas entre requisições
+class PoolConexoes:
+    def __init__(self, caminho, tamanho, timeout):
+        self.caminho = caminho
+        self.tamanho = max(1, tamanho)
+        self.timeout = timeout
+        self._livres = []
+        self._abertas = 0
+        self._pid = os.getpid()
+        self._condicao = threading.Condition()
+        self._checkouts = 0
+        self._esperas = 0
+        self._tempo_espera = 0.0
+        self._timeouts = 0
+        self._criadas = 0
+        self._avulsas = 0
+
+    def _abrir(self):
+        db_dir = os.path.dirname(self.caminho)
+        try:
+            # Verifica o diretório apenas quando uma nova conexão é aberta
+            if db_dir and not os.path.exists(db_dir):
+                os.makedirs(db_dir, exist_ok=True)
+                print(f"Criado diretório {db_dir}")
+
+            is_new_db = not os.path.exists(self.caminho)
+
+            conn = sqlite3.connect(
+                self.caminho,
+                timeout=DB_BUSY_TIMEOUT_MS / 1000,
+                factory=ConexaoPool,
+                check_same_thread=False
+            )
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}")
+            conn.execute(f"PRAGMA synchronous={DB_SYNCHRONOUS}")
+            conn.pool = self
+
+            if is_new_db:
+                print(f"Banco de dados criado em {self.caminho}")
+
+            return conn
+        except Exception as e:
+            print(f"ERRO ao conectar ao banco de dados: {str(e)}")
+            print(f"Verificando permissões do diretório: {os.access(db_dir, os.W_OK)}")
+            print(f"Verificando permissões do arquivo: {os.access(self.caminho, os.W_OK) if os.path.exists(self.caminho) else 'arquivo não existe'}")
+            raise
+
+    # Conexão fora do pool, usada pelas respostas em streaming: um cliente lento
+    # pode levar minutos para receber tudo e não deve ocupar uma das vagas do
+    # pool enquanto isso. close() fecha a conexão de vez.
+    def abrir_avulsa(self):
+        conn = self._abrir()
+        conn.pool = None
+        with self._condicao:
+            self._avulsas += 1
+        return conn
+
+    def obter(self):
+        with self._condicao:
+            # Conexões herdadas de outro processo (fork) não podem ser reutilizadas
+            if self._pid != os.getpid():
+                self._livres = []
+                self._abertas = 0
+                self._pid = os.getpid()
+
+            self._checkouts += 1
+            inicio_espera = None
+            while not self._livres and self._abertas >= self.tamanho:
+                if inicio_espera is None:
+                    inicio_espera = time.monotonic()
+                    self._esperas += 1
+                restante = self.timeout - (time.monotonic() - inicio_espera)
+                if restante <= 0:
+                    self._timeouts += 1
+                    self._tempo_espera += time.monotonic() - inicio_espera
+                    raise sqlite3.OperationalError('Tempo esgotado aguardando conexão livre no pool')
+                self._condicao.wait(restante)
+            if inicio_espera is not None:
+                self._tempo_espera += time.monotonic() - inicio_espera
+
+            if self._livres:
+                conn = self._livres.pop()
+                conn.no_pool = False
+                return conn
+            self._abertas += 1
+
+        try:
+            conn = self._abrir()
+        except Exception:
+            with self._condicao:
+                self._abertas -= 1
+                self._condicao.notify()
+            raise
+        with self._condicao:
+            self._criadas += 1
+        return conn
+
+    def devolver(self, conn):
+        if conn.no_pool:
+            return
+        try:
+            # Nunca devolver uma conexão com transação pendente
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            with self._condicao:
+                self._abertas -= 1
+                self._condicao.notify()
+            conn.fechar_definitivamente()
+            return
+        with self._condicao:
+            conn.no_pool = True
+            self._livres.append(conn)
+            self._condicao.notify()
+
+    def estatisticas(self):
+        with self._condicao:
+            return {
+                'tamanho': self.tamanho,
+                'abertas': self._abertas,
+                'livres': len(self._livres),
+                'em_uso': self._abertas - len(self._livres),
+                'criadas': self._criadas,
+                'avulsas': self._avulsas,
+                'checkouts': self._checkouts,
+                'esperas': self._esperas,
+                'tempo_espera_ms': round(self._tempo_espera * 1000, 3),
+                'timeouts': self._timeouts,
+                'pid': self._pid
+            }
+
+pool_conexoes = PoolConexoes(DATABASE_URL, DB_POOL_SIZE, DB_POOL_TIMEOUT)
+
+# Escritor do group commit, usado por PUT e DELETE de um registro
+escritor_agrupado = (
+    EscritorAgrupado(pool_conexoes.obter, trava_escrita.executar, ESCRITA_JANELA_MS, ESCRITA_LOTE_MAXIMO)
+    if ESCRITA_AGRUPADA else None
+)
+
+# Conexão própria do notificador de eventos, fora do pool: fica aberta enquanto
+# o worker existir e só faz leituras
+def abrir_conexao_eventos():
+    return sqlite3.connect(DATABASE_URL, timeout=DB_BUSY_TIMEOUT_MS / 1000, check_same_thread=False)
+
+notificador_alteracoes = NotificadorAlteracoes(abrir_conexao_eventos, EVENTOS_INTERVALO_MS, EVENTOS_MAXIMO)
 
 # Função para obter conexão com o banco
 def get_db_connection():
-    try:
-        # Verifica se o diretório do banco de dados existe
-        db_dir = os.path.dirname(DATABASE_URL)
-        if not os.path.exists(db_dir):
-            os.makedirs(db_dir, exist_ok=True)
-            print(f"Criado diretório {db_dir}")
-
-        # Verificar se o banco pode ser acessado
-        is_new_db = not os.path.exists(DATABASE_URL)
-        
-        # Criar conexão
-        conn = sqlite3.connect(DATABASE_URL)
-        conn.row_factory = sqlite3.Row
-        
-        if is_new_db:
-            print(f"Banco de dados criado em {DATABASE_URL}")
-            
-        return conn
-    except Exception as e:
-        print(f"ERRO ao conectar ao banco de dados: {str(e)}")
-        print(f"Verificando permissões do diretório: {os.access(db_dir, os.W_OK)}")
-        print(f"Verificando permissões do arquivo: {os.access(DATABASE_URL, os.W_OK) if os.path.exists(DATABASE_URL) else 'arquivo não existe'}")
-        raise
+    conn = pool_conexoes.obter()
+    # Registrar a conexão na requisição para devolvê-la mesmo se o handler falhar
+    if has_request_context():
+        g.setdefault('conexoes', []).append(conn)
+    return conn
+
+# Devolver ao pool conexões que um handler esqueceu de fechar
+@app.teardown_request
+def devolver_conexoes(exc):
+    for conn in g.pop('conexoes', []):
+        conn.close()
+
+# Tabelas de controle do servidor não são expostas pela API
+def tabela_interna(nome):
+    return nome == 'sqlite_sequence' or nome.startswith('_')
+
+# Registro das colunas que guardam JSON, decodificadas nas leituras. Outras
+# colunas podem ser registradas com COLUNAS_JSON="tabela.coluna,outra.coluna"
+# ou declaradas com o tipo JSON no CREATE TABLE
+REGISTRO_COLUNAS_JSON = {
+    'churches': {'dados'}
+}
+for _item in os.environ.get('COLUNAS_JSON', '').split(','):
+    if '.' in _item:
+        _tabela, _coluna = _item.strip().split('.', 1)
+        REGISTRO_COLUNAS_JSON.setdefault(_tabela, set()).add(_coluna)
+
+# Catálogo em memória das tabelas e colunas do banco. Só é recarregado quando
+# o PRAGMA schema_version muda (CREATE/ALTER/DROP feitos por qualquer processo).
+# Durante uma requisição a versão é conferida uma vez por conexão. A cada
+# recarga, instalar_gatilhos(conn, colunas, gatilhos) recebe as tabelas e os
+# nomes dos gatilhos existentes e devolve True se criou algum.
+class CatalogoEsquema:
+    def __init__(self, instalar_gatilhos=None):
+        self.instalar_gatilhos = instalar_gatilhos
+        self._versao_esquema = None
+        self._colunas = {}
+        self._tipos = {}
+        self._json = {}
+        self._trava = threading.Lock()
+        self.recargas = 0
+
+    def _atualizar(self, conn):
+        verificadas = g.setdefault('esquema_verificado', set()) if has_request_context() else None
+        if verificadas is not None and conn in verificadas:
+            return
+        versao = conn.execute("PRAGMA schema_version").fetchone()[0]
+        if verificadas is not None:
+            verificadas.add(conn)
+        if versao == self._versao_esquema:
+            return
+        with self._trava:
+            if versao == self._versao_esquema:
+                return
+            colunas = {}
+            tipos = {}
+            cursor = conn.execute("SELECT name FROM sqlite_master WHERE type='table'")
+            for (nome,) in cursor.fetchall():
+                info = conn.execute(f'PRAGMA table_info("{nome}")').fetchall()
+                colunas[nome] = [row[1] for row in info]
+                tipos[nome] = {row[1]: (row[2] or '').upper() for row in info}
+            gatilhos = {nome for (nome,) in conn.execute("SELECT name FROM sqlite_master WHERE type='trigger'").fetchall()}
+            self._colunas = colunas
+            self._tipos = tipos
+            # Colunas JSON: as do registro e as declaradas com o tipo JSON
+            self._json = {
+                nome: frozenset(
+                    coluna for coluna in colunas[nome]
+                    if coluna in REGISTRO_COLUNAS_JSON.get(nome, ()) or tipos[nome][coluna] == 'JSON'
+                )
+                for nome in colunas
+            }
+            self._versao_esquema = versao
+            self.recargas += 1
+
+        # Fora da trava do catálogo: a criação pode esperar pela trava de
+        # escrita, e quem a detém pode precisar do catálogo
+        if self.instalar_gatilhos is None:
+            return
+        try:
+            criados = self.instalar_gatilhos(conn, colunas, gatilhos)
+        except sqlite3.Error as e:
+            print(f"ERRO ao criar os gatilhos das tabelas: {str(e)}")
+            criados = True
+        if criados:
+            # Confere de novo na próxima consulta: a transação que criou os
+            # gatilhos pode ainda não ter feito commit (ou ter falhado)
+            self._versao_esquema = None
+
+    def tabelas(self, conn):
+        self._atualizar(conn)
+        return [nome for nome in self._colunas if not tabela_interna(nome)]
+
+    def existe(self, conn, tabela):
+        self._atualizar(conn)
+        return tabela in self._colunas
+
+    # Colunas da tabela (incluindo id), ou None se a tabela não existir
+    def colunas(self, conn, tabela):
+        self._atualizar(conn)
+        return self._colunas.get(tabela)
+
+    def tipos(self, conn, tabela):
+        self._atualizar(conn)
+        return self._tipos.get(tabela, {})
+
+    def colunas_json(self, conn, tabela):
+        self._atualizar(conn)
+        return self._json.get(tabela, frozenset())
+
+# Resposta padrão para tabelas que não existem no banco
+def tabela_inexistente(tabela):
+    return jsonify({
+        'error': f'no such table: {tabela}',
+        'message': f'Erro ao acessar tabela {tabela}. Verifique se a tabela existe.',
+        'sugestão': 'Use a rota /tabelas para listar as tabelas disponíveis.'
+    }), 500
+
+# Versão de cada tabela (_versoes_tabelas, criada pelas migrações),
+# incrementada por gatilhos em qualquer escrita: pela API ou por outro processo
+# que grave no mesmo arquivo. A linha '*' guarda um número aleatório do banco,
+# para que as versões de um banco recriado (o /tmp do Render é efêmero) não
+# coincidam com ETags antigas dos clientes.
+
+# Versão atual da tabela. As versões ficam no cache de leituras e só são
+# relidas do banco quando o PRAGMA data_version desta conexão muda, o que
+# indica um commit de outra conexão (de outro worker, por exemplo). As escritas
+# deste processo invalidam a tabela no cache logo após o commit.
+def versao_tabela(conn, tabela):
+    data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+    versao = cache_leituras.versao(tabela)
+    if versao is not None and data_version == conn.data_version_visto:
+        return versao
+
+    geracoes = cache_leituras.geracoes()
+    cursor = conn.execute("SELECT tabela, versao FROM _versoes_tabelas")
+    linhas = {row['tabela']: row['versao'] for row in cursor.fetchall()}
+    epoca = linhas.get('*', 0)
+    versoes = {
+        nome: f"{epoca:x}.{linhas.get(nome, 0)}"
+        for nome in set(catalogo.tabelas(conn)) | {tabela}
+    }
+    cache_leituras.atualizar_versoes(versoes, geracoes)
+    conn.data_version_visto = data_version
+    return versoes[tabela]
+
+def garantir_gatilhos_versao(conn, tabelas):
+    for tabela in tabelas:
+        for sufixo, operacao in (('ai', 'INSERT'), ('au', 'UPDATE'), ('ad', 'DELETE')):
+            conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS _versao_{tabela}_{sufixo} AFTER {operacao} ON "{tabela}" BEGIN
+                INSERT INTO _versoes_tabelas (tabela, versao) VALUES ('{tabela}', 1)
+                ON CONFLICT(tabela) DO UPDATE SET versao = versao + 1;
+            END
+            ''')
+
+# Chamada pelo catálogo a cada recarga do esquema: tabelas novas (criadas por
+# outro processo, inclusive) recebem os gatilhos de versão e, se tiverem id, os
+# do registro de alterações. Escritas feitas antes disso não são registradas.
+# Dentro de uma transação os gatilhos entram nela; senão a função abre a sua.
+def instalar_gatilhos(conn, colunas, gatilhos):
+    usuario = [nome for nome in colunas if not tabela_interna(nome)]
+    sem_versao = [nome for nome in usuario if f'_versao_{nome}_ad' not in gatilhos]
+    sem_alteracoes = [
+        nome for nome in usuario
+        if 'id' in colunas[nome] and f'_changelog_{nome}_ad' not in gatilhos
+    ]
+    if not sem_versao and not sem_alteracoes:
+        return False
+
+    def criar(conn):
+        garantir_gatilhos_versao(conn, sem_versao)
+        garantir_gatilhos_alteracoes(conn, sem_alteracoes)
+    if conn.in_transaction:
+        criar(conn)
+    else:
+        trava_escrita.executar(conn, criar)
+    return True
+
+catalogo = CatalogoEsquema(instalar_gatilhos)
+
+# Parâmetros da consulta em ordem fixa (o parâmetro 't', usado pelos clientes
+# para evitar cache, é ignorado)
+def consulta_normalizada():
+    parametros = sorted((k, v) for k, v in request.args.items(multi=True) if k != 't')
+    return f"{request.path}?{urlencode(parametros)}"
+
+# ETag de uma leitura: versão da tabela + caminho e parâmetros da consulta
+def etag_leitura(versao):
+    return f"{versao}.{zlib.crc32(consulta_normalizada().encode('utf-8')):08x}"
+
+def nao_modificado(etag):
+    if request.if_none_match.contains_weak(etag):
+        response = make_response('', 304)
+        response.set_etag(etag, weak=True)
+        return response
+    return None
 
 # Garantir que o banco de dados tenha a tabela 'churches'
 def ensure_tables_exist():
-    print(f"Inicializando banco de dados em: {DATABASE_URL}")
+    conn = None
     try:
         conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Listar tabelas existentes antes
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-        tabelas_antes = [row['name'] for row in cursor.fetchall() if row['name'] != 'sqlite_sequence']
-        print(f"Tabelas existentes antes: {tabelas_antes}")
-        
-        # Criar tabela churches se não existir
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS churches (
-            id TEXT PRIMARY KEY,
-            nome TEXT,
-            morada TEXT,
-            ano TEXT,
-            agendamento TEXT,
-            autorizadoFilippi TEXT,
-            arquivada INTEGER DEFAULT 0,
-            dados TEXT
-        )
-        ''')
-        
-        # Listar tabelas existentes depois
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-        tabelas_depois = [row['name'] for row in cursor.fetchall() if row['name'] != 'sqlite_sequence']
-        print(f"Tabelas existentes depois: {tabelas_depois}")
-        
-        # Verificar se há registros na tabela churches
-        cursor.execute("SELECT COUNT(*) FROM churches")
-        count = cursor.fetchone()[0]
-        print(f"Encontrados {count} registros na tabela churches")
-        
-        # Se não houver registros, adicionar um exemplo
-        if count == 0:
-            print("Adicionando registro de exemplo na tabela churches")
-            cursor.execute('''
-            INSERT INTO churches (id, nome, morada, ano, agendamento, autorizadoFilippi, arquivada, dados)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                'demo1', 
-                'Igreja Exemplo', 
-                'Rua de Exemplo, 123', 
-                '2023', 
-                'Sim', 
-                'Sim', 
-                0, 
-                json.dumps({"info": "Dados de exemplo para teste"})
-            ))
-        
-        conn.commit()
+        # Com o esquema em dia a verificação é uma única consulta, sem trava de
+        # escrita. Só com passos pendentes a transação é aberta (com as
+        # tentativas da TravaEscrita), e workers que sobem juntos migram um de
+        # cada vez: o segundo relê a versão e não encontra nada a fazer
+        if versao_atual(conn) < versao_mais_recente():
+            aplicadas = trava_escrita.executar(conn, aplicar_migracoes)
+            if aplicadas:
+                print(f"Migrações aplicadas: {aplicadas}")
+
+        # Carrega o catálogo (criando os gatilhos que faltarem) e os
+        # tokenizadores dos índices de busca criados pelas migrações
+        catalogo.tabelas(conn)
+        for tabela_busca in TABELAS_BUSCA:
+            tokenizadores_busca[tabela_busca] = tokenizador_indice(conn, tabela_busca)
+
         conn.close()
-        print(f"Banco de dados inicializado com sucesso em {DATABASE_URL}")
         return True
     except Exception as e:
         print(f"ERRO ao inicializar banco de dados: {str(e)}")
+        if conn is not None:
+            # Devolve a conexão ao pool, desfazendo a transação aberta
+            conn.close()
         # Exibir mais informações para diagnóstico
         try:
             # Verificar se o diretório existe
@@ -136,29 +639,159 @@ def ensure_tables_exist():
         
         return False
 
+# Tempos de inicialização deste worker, em ms
+tempos_inicio = {}
+diagnostico_banco = {}
+
+def registrar_fase(nome, inicio):
+    tempos_inicio[nome] = round((time.perf_counter() - inicio) * 1000, 1)
+
+# Informações de diagnóstico do banco. Roda em segundo plano depois que o
+# worker já está atendendo, para não atrasar a primeira resposta
+def diagnosticar_banco():
+    inicio = time.perf_counter()
+    try:
+        conn = get_db_connection()
+        try:
+            tabelas = catalogo.tabelas(conn)
+            registros = conn.execute("SELECT COUNT(*) FROM churches").fetchone()[0]
+            versao_esquema = versao_atual(conn)
+        finally:
+            conn.close()
+        diagnostico_banco.update({
+            'caminho': DATABASE_URL,
+            'tamanho_bytes': os.path.getsize(DATABASE_URL),
+            'tabelas': tabelas,
+            'registros_churches': registros,
+            'versao_esquema': versao_esquema,
+            'python': sys.version,
+            'diretorio': os.getcwd()
+        })
+        print(f"Tabelas existentes: {tabelas}")
+        print(f"Encontrados {registros} registros na tabela churches")
+    except Exception as e:
+        diagnostico_banco['erro'] = str(e)
+        print(f"ERRO no diagnóstico do banco: {str(e)}")
+    registrar_fase('diagnostico', inicio)
+
+# Coleta de métricas. O after_request é registrado antes dos demais para rodar
+# por último e medir o corpo final (já comprimido)
+@app.before_request
+def iniciar_metricas():
+    g.inicio_requisicao = time.perf_counter()
+    metricas.iniciar_requisicao()
+
+@app.after_request
+def registrar_metricas(response):
+    inicio = g.get('inicio_requisicao')
+    if inicio is not None:
+        rota = request.url_rule.rule if request.url_rule else 'sem_rota'
+        tamanho = None if response.is_streamed else response.content_length
+        metricas.registrar_resposta(request.method, rota, response.status_code, time.perf_counter() - inicio, tamanho)
+    return response
+
+@app.teardown_request
+def finalizar_metricas(exc):
+    if g.pop('inicio_requisicao', None) is not None:
+        metricas.finalizar_requisicao()
+
+# Perfil cProfile de uma requisição, pedido com os cabeçalhos X-Perfil: 1 e
+# X-Admin-Token. O resultado fica em /_perfis/<id>, informado no cabeçalho X-Perfil-Id.
+# Sem um token válido o cabeçalho X-Perfil é ignorado e a requisição segue normalmente
+@app.before_request
+def iniciar_perfil():
+    if not request.headers.get('X-Perfil') or not admin_autorizado():
+        return None
+    g.perfil_pedido = True
+    g.perfil = perfis_requisicao.iniciar()
+    return None
+
+@app.after_request
+def finalizar_perfil(response):
+    perfil = g.pop('perfil', None)
+    if perfil is not None:
+        response.headers['X-Perfil-Id'] = str(perfis_requisicao.finalizar(perfil, request.method, request.full_path))
+    elif g.pop('perfil_pedido', False):
+        response.headers['X-Perfil-Id'] = 'ocupado'
+    return response
+
+@app.teardown_request
+def descartar_perfil(exc):
+    # Requisição que terminou sem passar pelo after_request
+    perfil = g.pop('perfil', None)
+    if perfil is not None:
+        perfis_requisicao.finalizar(perfil, request.method, request.full_path)
+
 # Adicionar cabeçalhos CORS a todas as respostas
 @app.after_request
 def after_request(response):
     # Garantir que estes cabeçalhos estejam em todas as respostas
     response.headers.add('Access-Control-Allow-Origin', '*')
-    response.headers.add('Access-Control-Allow-Headers', 'Content-Type, Authorization, Accept, Origin, X-Requested-With')
+    response.headers.add('Access-Control-Allow-Headers', 'Content-Type, Authorization, Accept, Origin, X-Requested-With, If-None-Match')
     response.headers.add('Access-Control-Allow-Methods', 'GET, POST, PUT, DELETE, OPTIONS')
     response.headers.add('Access-Control-Max-Age', '86400')
     response.headers.add('Access-Control-Allow-Credentials', 'true')
     
-    # Prevenir problema com cache
-    response.headers.add('Cache-Control', 'no-store, no-cache, must-revalidate, max-age=0')
-    response.headers.add('Pragma', 'no-cache')
-    response.headers.add('Expires', '0')
+    # Prevenir problema com cache. Respostas com ETag podem ser guardadas,
+    # mas precisam ser revalidadas (If-None-Match) a cada uso
+    if 'ETag' in response.headers:
+        response.headers['Cache-Control'] = 'no-cache, must-revalidate, max-age=0'
+    else:
+        response.headers.add('Cache-Control', 'no-store, no-cache, must-revalidate, max-age=0')
+        response.headers.add('Pragma', 'no-cache')
+        response.headers.add('Expires', '0')
     return response
 
+# Comprimir respostas grandes conforme o Accept-Encoding do cliente. Respostas
+# com ETag (snapshots de tabela) guardam o corpo comprimido em cache, para não
+# comprimir de novo a cada consulta enquanto a tabela não mudar
+@app.after_request
+def comprimir_resposta(response):
+    response.vary.add('Accept-Encoding')
+    if (response.status_code != 200
+            or response.is_streamed
+            or response.direct_passthrough
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in ('application/json', 'text/plain', 'text/html')):
+        return response
+
+    codificacao = request.accept_encodings.best_match(codificacoes_disponiveis())
+    if codificacao is None:
+        return response
+
+    corpo = response.get_data()
+    if len(corpo) < COMPRESSAO_MIN_BYTES:
+        return response
+
+    etag, _ = response.get_etag()
+    chave = (codificacao, request.path, etag) if etag else None
+    comprimido = cache_compressao.obter(chave) if chave else None
+    if comprimido is None:
+        comprimido = comprimir(corpo, codificacao, COMPRESSAO_NIVEL_GZIP)
+        if chave:
+            cache_compressao.guardar(chave, comprimido)
+
+    response.set_data(comprimido)
+    response.headers['Content-Encoding'] = codificacao
+    return response
+
+# Estatísticas do cache de leituras deste worker
+@app.route('/_cache')
+def cache_stats():
+    return jsonify(cache_leituras.estatisticas())
+
+# Estatísticas do cache de respostas comprimidas deste worker
+@app.route('/_compressao')
+def compression_stats():
+    return jsonify(cache_compressao.estatisticas())
+
 # Rota OPTIONS global para preflight requests
 @app.route('/', defaults={'path': ''}, methods=['OPTIONS'])
 @app.route('/<path:path>', methods=['OPTIONS'])
 def options_handler(path):
     response = make_response()
     response.headers['Access-Control-Allow-Origin'] = '*'
-    response.headers['Access-Control-Allow-Headers'] = 'Content-Type, Authorization, Accept, Origin, X-Requested-With'
+    response.headers['Access-Control-Allow-Headers'] = 'Content-Type, Authorization, Accept, Origin, X-Requested-With, If-None-Match'
     response.headers['Access-Control-Allow-Methods'] = 'GET, POST, PUT, DELETE, OPTIONS'
     response.headers['Access-Control-Max-Age'] = '86400'
     response.headers['Access-Control-Allow-Credentials'] = 'true'
@@ -172,8 +805,7 @@ def check_db():
         cursor = conn.cursor()
         
         # Verificar quais tabelas existem
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-        tabelas = [row['name'] for row in cursor.fetchall() if row['name'] != 'sqlite_sequence']
+        tabelas = catalogo.tabelas(conn)
         
         # Testar a conexão com cada tabela
         resultados = {}
@@ -198,7 +830,13 @@ def check_db():
             "mensagem": "Banco de dados acessível",
             "caminho": DATABASE_URL,
             "tabelas": tabelas,
-            "detalhes": resultados
+            "detalhes": resultados,
+            "pool": pool_conexoes.estatisticas(),
+            "catalogo": {"recargas": catalogo.recargas},
+            "cache_leituras": cache_leituras.estatisticas(),
+            "escrita_agrupada": escritor_agrupado.estatisticas() if escritor_agrupado else None,
+            "trava_escrita": trava_escrita.estatisticas(),
+            "eventos": notificador_alteracoes.estatisticas()
         })
     except Exception as e:
         return jsonify({
@@ -207,6 +845,167 @@ def check_db():
             "caminho": DATABASE_URL
         }), 500
 
+# Rotas de manutenção exigem o cabeçalho X-Admin-Token igual a ADMIN_TOKEN
+def admin_autorizado():
+    token = request.headers.get('X-Admin-Token', '')
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(token, ADMIN_TOKEN)
+
+def acesso_negado():
+    return jsonify({
+        'error': 'Acesso negado',
+        'message': 'Envie o cabeçalho X-Admin-Token (a variável ADMIN_TOKEN precisa estar configurada).'
+    }), 403
+
+# Índices sugeridos a partir dos filtros e ordenações observados neste worker
+@app.route('/_indices', methods=['GET'])
+def listar_indices_sugeridos():
+    if not admin_autorizado():
+        return acesso_negado()
+    conn = get_db_connection()
+    try:
+        sugestoes = sugerir_indices(conn, observador_consultas, INDICE_MIN_CONSULTAS)
+        conn.close()
+    except sqlite3.Error as e:
+        conn.close()
+        return jsonify({'error': str(e)}), 500
+    filtros, ordens = observador_consultas.contagens()
+    return jsonify({
+        'sugestoes': sugestoes,
+        'janela_manutencao': JANELA_MANUTENCAO,
+        'dentro_da_janela': dentro_da_janela(JANELA_MANUTENCAO),
+        'observacoes': {
+            'filtros': {f'{tabela}.{coluna}': total for (tabela, coluna), total in filtros.items()},
+            'ordens': {f'{tabela}.{coluna}': total for (tabela, coluna), total in ordens.items()}
+        }
+    })
+
+# Cria os índices sugeridos. Fora da janela de manutenção exige ?forcar=1
+@app.route('/_indices', methods=['POST'])
+def aplicar_indices_sugeridos():
+    if not admin_autorizado():
+        return acesso_negado()
+    if not dentro_da_janela(JANELA_MANUTENCAO) and request.args.get('forcar') != '1':
+        return jsonify({
+            'error': 'Fora da janela de manutenção',
+            'janela_manutencao': JANELA_MANUTENCAO,
+            'message': 'Use ?forcar=1 para criar os índices mesmo assim.'
+        }), 409
+    conn = get_db_connection()
+    try:
+        sugestoes = sugerir_indices(conn, observador_consultas, INDICE_MIN_CONSULTAS)
+        criados = criar_indices(conn, sugestoes)
+        conn.close()
+    except sqlite3.Error as e:
+        conn.close()
+        return jsonify({'error': str(e)}), 500
+    return jsonify({'message': f'{len(criados)} índice(s) criado(s)', 'criados': criados})
+
+# Cria os índices sugeridos automaticamente quando estiver na janela de manutenção
+def criar_indices_automaticamente():
+    while True:
+        time.sleep(600)
+        if not dentro_da_janela(JANELA_MANUTENCAO):
+            continue
+        conn = None
+        try:
+            conn = get_db_connection()
+            criados = criar_indices(conn, sugerir_indices(conn, observador_consultas, INDICE_MIN_CONSULTAS))
+            if criados:
+                print(f"Índices criados automaticamente: {criados}")
+        except sqlite3.Error as e:
+            print(f"ERRO ao criar índices automaticamente: {str(e)}")
+        finally:
+            if conn is not None:
+                conn.close()
+
+if INDICES_AUTOMATICOS:
+    threading.Thread(target=criar_indices_automaticamente, daemon=True).start()
+
+# Tempo até a primeira resposta atendida por este worker
+@app.after_request
+def registrar_primeira_resposta(response):
+    if 'primeira_resposta' not in tempos_inicio:
+        registrar_fase('primeira_resposta', INICIO_IMPORTACAO)
+    return response
+
+# Relatório de inicialização deste worker (tempos em ms desde o início da importação,
+# exceto "esquema" e "diagnostico", que são a duração da própria fase)
+@app.route('/_inicio')
+def relatorio_inicio():
+    return jsonify({
+        'pid': os.getpid(),
+        'tempos_ms': tempos_inicio,
+        'diagnostico': diagnostico_banco
+    })
+
+# Consultas lentas registradas por este worker, da mais recente para a mais antiga
+@app.route('/_lentas')
+def listar_consultas_lentas():
+    if not admin_autorizado():
+        return acesso_negado()
+    return jsonify({
+        'limite_ms': CONSULTA_LENTA_MS,
+        'total': consultas_lentas.total,
+        'consultas': consultas_lentas.listar()
+    })
+
+# Perfis de requisição guardados por este worker
+@app.route('/_perfis')
+def listar_perfis():
+    if not admin_autorizado():
+        return acesso_negado()
+    return jsonify({'perfis': perfis_requisicao.listar()})
+
+@app.route('/_perfis/<int:id_perfil>')
+def obter_perfil(id_perfil):
+    if not admin_autorizado():
+        return acesso_negado()
+    perfil = perfis_requisicao.obter(id_perfil)
+    if perfil is None:
+        return jsonify({'error': 'Perfil não encontrado'}), 404
+    return jsonify_ordenado(perfil)
+
+# Métricas deste worker no formato do Prometheus
+@app.route('/metrics')
+def exportar_metricas():
+    pool = pool_conexoes.estatisticas()
+    leituras = cache_leituras.estatisticas()
+    comprimidas = cache_compressao.estatisticas()
+    extras = [
+        ('servidor_pool_conexoes_abertas', 'gauge', 'Conexoes SQLite abertas no pool', pool['abertas']),
+        ('servidor_pool_esperas_total', 'counter', 'Pedidos de conexao que esperaram o pool', pool['esperas']),
+        ('servidor_pool_timeouts_total', 'counter', 'Pedidos de conexao que desistiram por timeout', pool['timeouts']),
+        ('servidor_cache_leituras_acertos_total', 'counter', 'Acertos do cache de leituras', leituras['acertos']),
+        ('servidor_cache_leituras_falhas_total', 'counter', 'Falhas do cache de leituras', leituras['falhas']),
+        ('servidor_cache_leituras_bytes', 'gauge', 'Memoria usada pelo cache de leituras', leituras['bytes']),
+        ('servidor_cache_compressao_acertos_total', 'counter', 'Acertos do cache de respostas comprimidas', comprimidas['acertos'])
+    ]
+    travas = trava_escrita.estatisticas()
+    extras += [
+        ('servidor_escrita_transacoes_total', 'counter', 'Transacoes de escrita iniciadas', travas['transacoes']),
+        ('servidor_escrita_esperas_trava_total', 'counter', 'Transacoes que esperaram pela trava de escrita', travas['esperas_trava']),
+        ('servidor_escrita_espera_trava_segundos_total', 'counter', 'Tempo total esperando pela trava de escrita', round(travas['tempo_espera_ms'] / 1000, 6)),
+        ('servidor_escrita_retentativas_total', 'counter', 'Novas tentativas de BEGIN IMMEDIATE com o banco travado', travas['retentativas']),
+        ('servidor_escrita_desistencias_total', 'counter', 'Escritas que desistiram com o banco travado', travas['desistencias'])
+    ]
+    eventos = notificador_alteracoes.estatisticas()
+    extras += [
+        ('servidor_eventos_assinantes', 'gauge', 'Conexoes abertas em /_eventos', eventos['assinantes']),
+        ('servidor_eventos_enviados_total', 'counter', 'Eventos de alteracao lidos do registro', eventos['eventos'])
+    ]
+    if escritor_agrupado is not None:
+        escritas = escritor_agrupado.estatisticas()
+        extras += [
+            ('servidor_escrita_lotes_total', 'counter', 'Transacoes confirmadas pelo escritor agrupado', escritas['lotes']),
+            ('servidor_escrita_pedidos_total', 'counter', 'Escritas confirmadas pelo escritor agrupado', escritas['pedidos'])
+        ]
+    return Response(metricas.formatar(extras), mimetype='text/plain; version=0.0.4')
+
+# Estatísticas do pool de conexões deste worker
+@app.route('/_pool')
+def pool_stats():
+    return jsonify(pool_conexoes.estatisticas())
+
 # Redirecionar solicitações com caminho incorreto para a raiz
 @app.route('/ping/<path:path>', methods=['GET'])
 def redirect_ping(path):
@@ -228,17 +1027,46 @@ def health_check():
         'version': '1.3.0'
     })
 
-# Função para converter objetos JSON armazenados como string de volta para objetos Python
-def parse_json_fields(data):
+# Função para converter objetos JSON armazenados como string de volta para objetos Python.
+# Só as colunas registradas como JSON são decodificadas; as demais voltam como estão
+def parse_json_fields(data, colunas_json):
     if isinstance(data, dict):
-        for key, value in data.items():
+        for key in colunas_json:
+            value = data.get(key)
             if isinstance(value, str):
                 try:
                     data[key] = json.loads(value)
-                except (json.JSONDecodeError, TypeError):
+                except json.JSONDecodeError:
                     pass
     return data
 
+# Colunas JSON a decodificar na requisição atual (nenhuma com ?bruto=1)
+def colunas_json_requisicao(conn, tabela):
+    if request.args.get('bruto') in ('1', 'true'):
+        return frozenset()
+    return catalogo.colunas_json(conn, tabela)
+
+# Gera o JSON de uma tabela inteira aos poucos, no mesmo formato de jsonify
+# (chaves ordenadas, separadores compactos), sem materializar a tabela na memória.
+# A conexão é devolvida por quem monta a resposta (ver get_all)
+def gerar_json_tabela(cursor, primeiro_lote, colunas_json):
+    codificar = app.json.codificar
+    lote = primeiro_lote
+    separador = b'{'
+    while lote:
+        partes = []
+        for registro in lote:
+            dados = dict(registro)
+            id_registro = dados.pop('id')
+            partes.append(separador)
+            partes.append(codificar(str(id_registro)))
+            partes.append(b':')
+            partes.append(codificar(parse_json_fields(dados, colunas_json)))
+            separador = b','
+        yield b''.join(partes)
+        lote = cursor.fetchmany(LOTE_STREAM)
+    yield b'{}\n' if separador == b'{' else b'}\n'
+
 # Rota principal
 @app.route('/')
 def index():
@@ -270,39 +1098,219 @@ def server_error(e):
 @app.route('/tabelas')
 def list_tables():
     conn = get_db_connection()
-    cursor = conn.cursor()
     
-    # Consulta para listar todas as tabelas
-    cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-    tabelas = [row['name'] for row in cursor.fetchall() if row['name'] != 'sqlite_sequence']
+    # Lista de tabelas vinda do catálogo em memória
+    tabelas = catalogo.tabelas(conn)
     
     conn.close()
     return jsonify({'tabelas': tabelas})
 
+# Parâmetros de GET /<tabela> que não são filtros ('t' é o anti-cache dos clientes)
+PARAMETROS_RESERVADOS = {'limit', 'after', 'stream', 'campos', 'ordenar', 'bruto', 't'}
+
+# Operadores aceitos nos filtros: coluna=valor ou coluna__operador=valor
+OPERADORES_FILTRO = {
+    'eq': '=',
+    'ne': '!=',
+    'gt': '>',
+    'gte': '>=',
+    'lt': '<',
+    'lte': '<=',
+    'in': 'IN'
+}
+
+class ParametroInvalido(ValueError):
+    pass
+
+# Traduz os parâmetros da requisição para SQL parametrizado. Os nomes de
+# colunas só entram na consulta depois de conferidos com o catálogo
+def montar_consulta(colunas, args):
+    selecao = '*'
+    if args.get('campos'):
+        campos = [campo.strip() for campo in args['campos'].split(',') if campo.strip()]
+        desconhecidos = [campo for campo in campos if campo not in colunas]
+        if desconhecidos:
+            raise ParametroInvalido(f"Campos desconhecidos em 'campos': {', '.join(desconhecidos)}")
+        # O id é sempre incluído, pois é a chave da resposta
+        selecao = ', '.join(f'"{campo}"' for campo in ['id'] + [c for c in campos if c != 'id'])
+
+    condicoes = []
+    parametros = []
+    colunas_filtro = []
+    for chave, valor in args.items(multi=True):
+        if chave in PARAMETROS_RESERVADOS or chave.startswith('_'):
+            continue
+        coluna, _, operador = chave.partition('__')
+        operador = operador or 'eq'
+        if coluna not in colunas:
+            raise ParametroInvalido(f"Filtro por coluna desconhecida: {coluna}")
+        if operador not in OPERADORES_FILTRO:
+            raise ParametroInvalido(f"Operador de filtro desconhecido: {operador}. Use {', '.join(OPERADORES_FILTRO)}")
+        colunas_filtro.append(coluna)
+        if operador == 'in':
+            valores = valor.split(',')
+            if len(valores) > 500:
+                raise ParametroInvalido("O operador 'in' aceita no máximo 500 valores")
+            condicoes.append(f'"{coluna}" IN ({", ".join(["?"] * len(valores))})')
+            parametros.extend(valores)
+        else:
+            condicoes.append(f'"{coluna}" {OPERADORES_FILTRO[operador]} ?')
+            parametros.append(valor)
+
+    ordem = []
+    colunas_ordem = []
+    if args.get('ordenar'):
+        for campo in args['ordenar'].split(','):
+            campo = campo.strip()
+            direcao = 'DESC' if campo.startswith('-') else 'ASC'
+            campo = campo.lstrip('-+')
+            if campo not in colunas:
+                raise ParametroInvalido(f"Ordenação por coluna desconhecida: {campo}")
+            colunas_ordem.append(campo)
+            ordem.append(f'"{campo}" {direcao}')
+        # Desempate pela chave primária para uma ordem estável
+        if not any(item.startswith('"id" ') for item in ordem):
+            ordem.append('"id" ASC')
+
+    return {
+        'selecao': selecao,
+        'condicoes': condicoes,
+        'parametros': parametros,
+        'ordem': ordem,
+        'colunas_filtro': colunas_filtro,
+        'colunas_ordem': colunas_ordem
+    }
+
+# Resposta JSON que preserva a ordem das chaves (jsonify ordena as chaves)
+def jsonify_ordenado(dados):
+    return jsonify(app.json.codificar(dados, ordenar_chaves=False) + b'\n')
+
 # Obter todos os registros de uma tabela
 @app.route('/<tabela>', methods=['GET'])
 def get_all(tabela):
     # Se for uma das rotas especiais, redirecionar
     if tabela in ['ping', 'health', 'check-db']:
         return redirect(f'/{tabela}', code=302)
-        
+    if tabela_interna(tabela):
+        return not_found(None)
+
+    # Paginação por cursor (keyset) sobre a chave primária
+    paginado = 'limit' in request.args or 'after' in request.args
+    if paginado:
+        try:
+            limite = int(request.args.get('limit', PAGINA_PADRAO))
+        except ValueError:
+            return jsonify({'error': 'Parâmetro limit deve ser um número inteiro'}), 400
+        if limite < 1 or limite > PAGINA_MAXIMA:
+            return jsonify({'error': f'Parâmetro limit deve estar entre 1 e {PAGINA_MAXIMA}'}), 400
+        depois = request.args.get('after')
+        if depois is not None and request.args.get('ordenar'):
+            return jsonify({'error': 'O parâmetro after só pode ser usado com a ordenação padrão (por id)'}), 400
+    # HEAD não tem corpo: a resposta comum traz o Content-Length sem abrir um stream
+    stream = not paginado and request.method != 'HEAD' and request.args.get('stream') in ('1', 'true')
+
     conn = get_db_connection()
     cursor = conn.cursor()
     
     try:
-        cursor.execute(f"SELECT * FROM {tabela}")
+        colunas = catalogo.colunas(conn, tabela)
+        if colunas is None:
+            conn.close()
+            return tabela_inexistente(tabela)
+
+        try:
+            consulta = montar_consulta(colunas, request.args)
+        except ParametroInvalido as e:
+            conn.close()
+            return jsonify({'error': str(e), 'colunas': colunas}), 400
+        observador_consultas.registrar(tabela, consulta['colunas_filtro'], consulta['colunas_ordem'])
+
+        # A versão é lida antes dos dados: se uma escrita acontecer no meio,
+        # o cliente recebe um ETag antigo e apenas baixa a tabela de novo
+        versao = versao_tabela(conn, tabela)
+        etag = etag_leitura(versao)
+        nao_mudou = nao_modificado(etag)
+        if nao_mudou:
+            conn.close()
+            return nao_mudou
+
+        chave_cache = consulta_normalizada()
+        if not stream:
+            corpo = cache_leituras.obter(tabela, chave_cache, versao)
+            if corpo is not None:
+                conn.close()
+                response = jsonify(corpo)
+                response.set_etag(etag, weak=True)
+                return response
+
+        condicoes = list(consulta['condicoes'])
+        parametros = list(consulta['parametros'])
+        if paginado and depois is not None:
+            condicoes.append('id > ?')
+            parametros.append(depois)
+
+        sql = f"SELECT {consulta['selecao']} FROM {tabela}"
+        if condicoes:
+            sql += f" WHERE {' AND '.join(condicoes)}"
+        if consulta['ordem']:
+            sql += f" ORDER BY {', '.join(consulta['ordem'])}"
+        elif paginado or stream:
+            # A ordem por id reproduz as chaves ordenadas do jsonify
+            sql += " ORDER BY id"
+        if paginado:
+            # Um registro extra indica que existe uma próxima página
+            sql += " LIMIT ?"
+            parametros.append(limite + 1)
+
+        if stream:
+            # O stream lê de uma conexão própria, fora do pool, e a do pool
+            # volta agora. A versão do ETag foi lida antes, como acima
+            colunas_json = colunas_json_requisicao(conn, tabela)
+            conn.close()
+            conn_stream = pool_conexoes.abrir_avulsa()
+            try:
+                cursor = conn_stream.execute(sql, parametros)
+                primeiro_lote = cursor.fetchmany(LOTE_STREAM)
+            except sqlite3.Error:
+                conn_stream.close()
+                raise
+            response = Response(gerar_json_tabela(cursor, primeiro_lote, colunas_json), mimetype='application/json')
+            # O servidor chama close() da resposta mesmo quando o corpo não é
+            # lido (cliente desconectado antes do primeiro trecho)
+            response.call_on_close(conn_stream.close)
+            response.set_etag(etag, weak=True)
+            return response
+
+        cursor.execute(sql, parametros)
+
         registros = cursor.fetchall()
+
+        proximo_cursor = None
+        if paginado and len(registros) > limite:
+            registros = registros[:limite]
+            # Com ordenação personalizada a resposta é apenas um "top N"
+            if not consulta['ordem']:
+                proximo_cursor = registros[-1]['id']
         
         # Converter os resultados para um dicionário
+        colunas_json = colunas_json_requisicao(conn, tabela)
         resultado = {}
         for registro in registros:
             dados = dict(registro)
             id_registro = dados.pop('id')
             # Parse JSON strings back to objects
-            resultado[id_registro] = parse_json_fields(dados)
+            resultado[id_registro] = parse_json_fields(dados, colunas_json)
             
         conn.close()
-        return jsonify(resultado)
+        if paginado:
+            resultado = {
+                'registros': resultado,
+                'next_cursor': proximo_cursor
+            }
+        response = jsonify_ordenado(resultado) if consulta['ordem'] else jsonify(resultado)
+        cache_leituras.guardar(tabela, chave_cache, versao, response.get_data())
+        response.set_etag(etag, weak=True)
+        return response
     except sqlite3.Error as e:
         conn.close()
         return jsonify({
@@ -311,13 +1319,157 @@ def get_all(tabela):
             'sugestão': 'Use a rota /tabelas para listar as tabelas disponíveis.'
         }), 500
 
+# Busca textual com resultados do mais para o menos relevante
+@app.route('/<tabela>/_busca', methods=['GET'])
+def search(tabela):
+    if tabela not in TABELAS_BUSCA:
+        return jsonify({'error': f'A tabela {tabela} não tem busca textual'}), 404
+
+    texto = request.args.get('q', '').strip()
+    if not texto:
+        return jsonify({'error': 'Informe o texto da busca no parâmetro q'}), 400
+    try:
+        limite = int(request.args.get('limit', BUSCA_LIMITE_PADRAO))
+    except ValueError:
+        return jsonify({'error': 'Parâmetro limit deve ser um número inteiro'}), 400
+    if limite < 1 or limite > PAGINA_MAXIMA:
+        return jsonify({'error': f'Parâmetro limit deve estar entre 1 e {PAGINA_MAXIMA}'}), 400
+
+    conn = get_db_connection()
+    try:
+        if not catalogo.existe(conn, tabela):
+            conn.close()
+            return tabela_inexistente(tabela)
+
+        # O índice é criado pelas migrações; um banco trocado depois da
+        # inicialização é consultado de novo
+        if tokenizadores_busca.get(tabela) is None:
+            tokenizadores_busca[tabela] = tokenizador_indice(conn, tabela)
+        tokenizador = tokenizadores_busca[tabela]
+        if tokenizador is None:
+            conn.close()
+            return jsonify({'error': 'Busca textual indisponível: o SQLite deste servidor não tem FTS5'}), 501
+
+        etag = etag_leitura(versao_tabela(conn, tabela))
+        nao_mudou = nao_modificado(etag)
+        if nao_mudou:
+            conn.close()
+            return nao_mudou
+
+        registros = buscar(conn, tabela, TABELAS_BUSCA[tabela], tokenizador, texto, limite)
+
+        # Mesmo formato de GET /<tabela>, com as chaves na ordem de relevância
+        colunas_json = colunas_json_requisicao(conn, tabela)
+        resultado = {}
+        for registro in registros:
+            dados = dict(registro)
+            id_registro = dados.pop('id')
+            resultado[id_registro] = parse_json_fields(dados, colunas_json)
+
+        conn.close()
+        response = jsonify_ordenado(resultado)
+        response.set_etag(etag, weak=True)
+        return response
+    except sqlite3.Error as e:
+        conn.close()
+        return jsonify({'error': str(e)}), 500
+
+# Árvores já montadas, por (tabela, colunas), com a versão da tabela em que
+# foram montadas. Qualquer escrita pela API muda a versão e a árvore é refeita
+# no próximo pedido.
+arvores_merkle = {}
+trava_arvores_merkle = threading.Lock()
+
+def arvore_merkle(conn, tabela, colunas, versao):
+    chave = (tabela, tuple(colunas))
+    with trava_arvores_merkle:
+        guardada = arvores_merkle.get(chave)
+        if guardada is not None and guardada[0] == versao:
+            return guardada[1]
+        selecao = ', '.join(['"id"'] + [f'"{coluna}"' for coluna in colunas])
+        linhas = conn.execute(f'SELECT {selecao} FROM "{tabela}"').fetchall()
+        arvore = ArvoreMerkle.construir(((row[0], tuple(row)[1:]) for row in linhas), MERKLE_FOLHA)
+        arvores_merkle.pop(chave, None)
+        arvores_merkle[chave] = (versao, arvore)
+        while len(arvores_merkle) > MERKLE_ARVORES_MAXIMO:
+            arvores_merkle.pop(next(iter(arvores_merkle)))
+        return arvore
+
+# Nós da árvore Merkle da tabela, para a sincronização comparar o conteúdo dos
+# dois bancos sem baixar a tabela. ?prefixo=<hex> pode se repetir (o prefixo
+# vazio é a raiz); ?colunas=a,b limita as colunas comparadas às que o outro
+# lado também tem. A resposta diz quais colunas foram usadas.
+@app.route('/<tabela>/_merkle', methods=['GET'])
+def merkle(tabela):
+    if tabela_interna(tabela):
+        return not_found(None)
+
+    prefixos = request.args.getlist('prefixo') or ['']
+    if len(prefixos) > MERKLE_PREFIXOS_MAXIMO:
+        return jsonify({'error': f'Máximo de {MERKLE_PREFIXOS_MAXIMO} prefixos por requisição'}), 400
+    if any(len(prefixo) > 16 or any(caractere not in DIGITOS for caractere in prefixo) for prefixo in prefixos):
+        return jsonify({'error': 'Prefixos devem ter até 16 dígitos hexadecimais minúsculos'}), 400
+
+    conn = get_db_connection()
+    try:
+        colunas_tabela = catalogo.colunas(conn, tabela)
+        if colunas_tabela is None:
+            conn.close()
+            return tabela_inexistente(tabela)
+        colunas = sorted(coluna for coluna in colunas_tabela if coluna != 'id')
+        if request.args.get('colunas') is not None:
+            pedidas = set(request.args['colunas'].split(','))
+            colunas = [coluna for coluna in colunas if coluna in pedidas]
+
+        versao = versao_tabela(conn, tabela)
+        etag = etag_leitura(versao)
+        nao_mudou = nao_modificado(etag)
+        if nao_mudou:
+            conn.close()
+            return nao_mudou
+
+        arvore = arvore_merkle(conn, tabela, colunas, versao)
+        conn.close()
+    except sqlite3.Error as e:
+        conn.close()
+        return jsonify({'error': str(e)}), 500
+
+    response = jsonify({
+        'colunas': colunas,
+        'nos': {prefixo: arvore.descrever(prefixo) for prefixo in prefixos}
+    })
+    response.set_etag(etag, weak=True)
+    return response
+
 # Obter um registro específico
 @app.route('/<tabela>/<id>', methods=['GET'])
 def get_one(tabela, id):
+    if tabela_interna(tabela):
+        return not_found(None)
+
     conn = get_db_connection()
     cursor = conn.cursor()
     
     try:
+        if not catalogo.existe(conn, tabela):
+            conn.close()
+            return jsonify({'error': f'no such table: {tabela}'}), 500
+
+        versao = versao_tabela(conn, tabela)
+        etag = etag_leitura(versao)
+        nao_mudou = nao_modificado(etag)
+        if nao_mudou:
+            conn.close()
+            return nao_mudou
+
+        chave_cache = consulta_normalizada()
+        corpo = cache_leituras.obter(tabela, chave_cache, versao)
+        if corpo is not None:
+            conn.close()
+            response = jsonify(corpo)
+            response.set_etag(etag, weak=True)
+            return response
+
         cursor.execute(f"SELECT * FROM {tabela} WHERE id = ?", (id,))
         registro = cursor.fetchone()
         
@@ -325,9 +1477,12 @@ def get_one(tabela, id):
             dados = dict(registro)
             id_registro = dados.pop('id')
             # Parse JSON strings back to objects
-            resultado = parse_json_fields(dados)
+            resultado = parse_json_fields(dados, colunas_json_requisicao(conn, tabela))
             conn.close()
-            return jsonify({id_registro: resultado})
+            response = jsonify({id_registro: resultado})
+            cache_leituras.guardar(tabela, chave_cache, versao, response.get_data())
+            response.set_etag(etag, weak=True)
+            return response
         else:
             conn.close()
             return jsonify({'error': 'Registro não encontrado'}), 404
@@ -335,85 +1490,435 @@ def get_one(tabela, id):
         conn.close()
         return jsonify({'error': str(e)}), 500
 
+# Seleciona as colunas conhecidas de um registro, convertendo objetos complexos para JSON
+def preparar_campos(columns, dados):
+    campos = []
+    valores = []
+    for column in columns:
+        if column in dados:
+            valor = dados[column]
+            if isinstance(valor, (dict, list)):
+                valor = json.dumps(valor)
+            campos.append(column)
+            valores.append(valor)
+    return campos, valores
+
 # Inserir um novo registro
 @app.route('/<tabela>/<id>', methods=['PUT'])
 def insert_or_update(tabela, id):
+    if tabela_interna(tabela):
+        return not_found(None)
+
     dados = request.json
     
     if not dados:
         return jsonify({'error': 'Dados não fornecidos'}), 400
-        
-    conn = get_db_connection()
+
+    try:
+        corpo, status = executar_escrita(lambda conn: gravar_registro(conn, tabela, id, dados))
+    except sqlite3.Error as e:
+        return erro_escrita(e)
+    if status == 200:
+        cache_leituras.invalidar_tabela(tabela)
+    return jsonify(corpo), status
+
+# Grava um registro (UPDATE e, se nenhuma linha mudou, INSERT). Roda dentro da
+# transação aberta por executar_escrita e devolve (corpo, status) da resposta
+def gravar_registro(conn, tabela, id, dados):
+    # Obtém as colunas da tabela pelo catálogo
+    colunas_tabela = catalogo.colunas(conn, tabela)
+    if colunas_tabela is None:
+        return {'error': f'no such table: {tabela}'}, 500
+    columns = [coluna for coluna in colunas_tabela if coluna != 'id']
+    
+    # Prepara os valores e campos para inserção/atualização
+    campos_atualizados, valores = preparar_campos(columns, dados)
+    
+    if not campos_atualizados:
+        return {'error': 'Nenhum campo válido fornecido'}, 400
+
     cursor = conn.cursor()
+    # Tenta atualizar primeiro; se nenhuma linha mudou, o registro não existe
+    query = f"UPDATE {tabela} SET {', '.join([f'{campo} = ?' for campo in campos_atualizados])} WHERE id = ?"
+    cursor.execute(query, valores + [id])
     
+    if cursor.rowcount > 0:
+        message = 'Registro atualizado com sucesso'
+    else:
+        # Insere um novo registro
+        query = f"INSERT INTO {tabela} (id, {', '.join(campos_atualizados)}) VALUES (?, {', '.join(['?'] * len(campos_atualizados))})"
+        cursor.execute(query, [id] + valores)
+        message = 'Registro inserido com sucesso'
+
+    return {'message': message}, 200
+
+# Executa funcao(conn) e confirma a transação. Com ESCRITA_AGRUPADA=1 a escrita
+# entra no próximo lote do escritor do worker; senão usa uma conexão do pool e
+# faz o próprio commit. Nos dois casos o retorno só acontece depois do commit.
+def executar_escrita(funcao):
+    if escritor_agrupado is not None:
+        return escritor_agrupado.executar(funcao)
+    conn = get_db_connection()
     try:
-        # Obtém as colunas da tabela
-        cursor.execute(f"PRAGMA table_info({tabela})")
-        columns = [row['name'] for row in cursor.fetchall() if row['name'] != 'id']
-        
-        # Prepara os valores e campos para inserção/atualização
-        valores = []
-        campos_atualizados = []
-        
-        for column in columns:
-            if column in dados:
-                valor = dados[column]
-                # Converte objetos complexos para JSON
-                if isinstance(valor, (dict, list)):
-                    valor = json.dumps(valor)
-                valores.append(valor)
-                campos_atualizados.append(column)
-        
-        if not campos_atualizados:
+        return trava_escrita.executar(conn, funcao)
+    finally:
+        conn.close()
+
+# Resposta para falhas de escrita. Banco ainda travado depois de todas as
+# tentativas vira 503 com Retry-After, para o cliente tentar mais tarde
+def erro_escrita(e):
+    response = jsonify({'error': str(e)})
+    if banco_travado(e):
+        response.status_code = 503
+        response.headers['Retry-After'] = '1'
+    else:
+        response.status_code = 500
+    return response
+
+# Executa um grupo de escritas com a mesma forma via executemany. Se o grupo
+# falhar (ex.: restrição violada), repete registro a registro para isolar os erros
+def executar_grupo(conn, query, grupo, resultados, status):
+    conn.execute("SAVEPOINT grupo_lote")
+    try:
+        conn.executemany(query, [parametros for _, parametros in grupo])
+        conn.execute("RELEASE grupo_lote")
+        for id_registro, _ in grupo:
+            resultados[id_registro] = {'status': status}
+        return
+    except sqlite3.Error:
+        conn.execute("ROLLBACK TO grupo_lote")
+        conn.execute("RELEASE grupo_lote")
+
+    for id_registro, parametros in grupo:
+        conn.execute("SAVEPOINT registro_lote")
+        try:
+            conn.execute(query, parametros)
+            conn.execute("RELEASE registro_lote")
+            resultados[id_registro] = {'status': status}
+        except sqlite3.Error as e:
+            conn.execute("ROLLBACK TO registro_lote")
+            conn.execute("RELEASE registro_lote")
+            resultados[id_registro] = {'status': 'erro', 'error': str(e)}
+
+# Inserir ou atualizar vários registros em uma única transação.
+# Corpo no mesmo formato de GET /<tabela>: {"<id>": {...}, ...}
+@app.route('/<tabela>', methods=['PUT'])
+def bulk_upsert(tabela):
+    if tabela_interna(tabela):
+        return not_found(None)
+
+    registros = request.get_json(silent=True)
+
+    if not registros or not isinstance(registros, dict):
+        return jsonify({'error': 'Dados não fornecidos. Envie um objeto {"<id>": {...}}'}), 400
+    if len(registros) > LOTE_MAXIMO:
+        return jsonify({'error': f'Máximo de {LOTE_MAXIMO} registros por requisição'}), 413
+
+    conn = get_db_connection()
+
+    try:
+        colunas_tabela = catalogo.colunas(conn, tabela)
+        if colunas_tabela is None:
             conn.close()
-            return jsonify({'error': 'Nenhum campo válido fornecido'}), 400
-            
-        # Verifica se o registro já existe
-        cursor.execute(f"SELECT id FROM {tabela} WHERE id = ?", (id,))
-        existe = cursor.fetchone()
-        
-        if existe:
-            # Atualiza o registro existente
-            query = f"UPDATE {tabela} SET {', '.join([f'{campo} = ?' for campo in campos_atualizados])} WHERE id = ?"
-            cursor.execute(query, valores + [id])
-            message = 'Registro atualizado com sucesso'
-        else:
-            # Insere um novo registro
-            query = f"INSERT INTO {tabela} (id, {', '.join(campos_atualizados)}) VALUES (?, {', '.join(['?'] * len(campos_atualizados))})"
-            cursor.execute(query, [id] + valores)
-            message = 'Registro inserido com sucesso'
-            
+            return jsonify({'error': f'no such table: {tabela}'}), 500
+        columns = [coluna for coluna in colunas_tabela if coluna != 'id']
+
+        resultados = {}
+        preparados = {}
+        for id_registro, dados in registros.items():
+            campos, valores = preparar_campos(columns, dados) if isinstance(dados, dict) else ([], [])
+            if campos:
+                preparados[id_registro] = (campos, valores)
+            else:
+                resultados[id_registro] = {'status': 'erro', 'error': 'Nenhum campo válido fornecido'}
+
+        trava_escrita.iniciar(conn)
+
+        # Descobre de uma vez quais registros já existem. A comparação fica com
+        # o SQLite, que aplica o tipo da coluna id às chaves do JSON (sempre
+        # texto): em uma INTEGER PRIMARY KEY, "5" encontra o registro 5
+        existentes = set()
+        ids = list(preparados)
+        for inicio in range(0, len(ids), 500):
+            parte = ids[inicio:inicio + 500]
+            cursor = conn.execute(
+                f"SELECT column1 FROM (VALUES {', '.join(['(?)'] * len(parte))}) "
+                f"WHERE column1 IN (SELECT id FROM {tabela})",
+                parte
+            )
+            existentes.update(row[0] for row in cursor.fetchall())
+
+        # Agrupa por operação e conjunto de campos para usar executemany
+        grupos = {}
+        for id_registro, (campos, valores) in preparados.items():
+            existe = id_registro in existentes
+            parametros = valores + [id_registro] if existe else [id_registro] + valores
+            grupos.setdefault((existe, tuple(campos)), []).append((id_registro, parametros))
+
+        for (existe, campos), grupo in grupos.items():
+            if existe:
+                query = f"UPDATE {tabela} SET {', '.join([f'{campo} = ?' for campo in campos])} WHERE id = ?"
+                executar_grupo(conn, query, grupo, resultados, 'atualizado')
+            else:
+                query = f"INSERT INTO {tabela} (id, {', '.join(campos)}) VALUES (?, {', '.join(['?'] * len(campos))})"
+                executar_grupo(conn, query, grupo, resultados, 'inserido')
+
+        totais = {'inserido': 0, 'atualizado': 0, 'erro': 0}
+        for resultado in resultados.values():
+            totais[resultado['status']] += 1
+
         conn.commit()
+        cache_leituras.invalidar_tabela(tabela)
         conn.close()
-        return jsonify({'message': message})
+        return jsonify({
+            'message': 'Lote processado',
+            'inseridos': totais['inserido'],
+            'atualizados': totais['atualizado'],
+            'erros': totais['erro'],
+            'resultados': resultados
+        })
     except sqlite3.Error as e:
         conn.close()
-        return jsonify({'error': str(e)}), 500
+        return erro_escrita(e)
 
 # Excluir um registro
 @app.route('/<tabela>/<id>', methods=['DELETE'])
 def delete(tabela, id):
+    if tabela_interna(tabela):
+        return not_found(None)
+
+    try:
+        corpo, status = executar_escrita(lambda conn: excluir_registro(conn, tabela, id))
+    except sqlite3.Error as e:
+        return erro_escrita(e)
+    if status == 200:
+        cache_leituras.invalidar_tabela(tabela)
+    return jsonify(corpo), status
+
+def excluir_registro(conn, tabela, id):
+    if not catalogo.existe(conn, tabela):
+        return {'error': f'no such table: {tabela}'}, 500
+
+    cursor = conn.execute(f"DELETE FROM {tabela} WHERE id = ?", (id,))
+    if cursor.rowcount == 0:
+        return {'error': 'Registro não encontrado'}, 404
+    return {'message': 'Registro excluído com sucesso'}, 200
+
+# Alterações com seq maior que ?since, em ordem, com o registro atual de cada
+# inserção/atualização e só o id nas exclusões (tombstones). O consumidor
+# guarda "since" da resposta e continua dali; com "mais" verdadeiro há outra
+# página esperando. since anterior ao horizonte da compactação devolve 410:
+# exclusões daquele período já foram descartadas e é preciso baixar as tabelas.
+@app.route('/_changes')
+def listar_changes():
+    try:
+        desde = int(request.args.get('since', 0))
+        limite = int(request.args.get('limit', PAGINA_PADRAO))
+    except ValueError:
+        return jsonify({'error': 'since e limit devem ser inteiros'}), 400
+    if desde < 0:
+        return jsonify({'error': 'since não pode ser negativo'}), 400
+    if limite < 1:
+        return jsonify({'error': 'limit deve ser maior que zero'}), 400
+    limite = min(limite, PAGINA_MAXIMA)
+    tabela = request.args.get('tabela')
+    com_dados = request.args.get('dados', '1') != '0'
+
     conn = get_db_connection()
-    cursor = conn.cursor()
-    
     try:
-        cursor.execute(f"DELETE FROM {tabela} WHERE id = ?", (id,))
-        conn.commit()
-        
-        if cursor.rowcount > 0:
-            conn.close()
-            return jsonify({'message': 'Registro excluído com sucesso'})
-        else:
+        # Uma transação de leitura: o log e os registros vêm do mesmo instante
+        conn.execute("BEGIN")
+        limite_compactacao = horizonte(conn)
+        if desde < limite_compactacao:
+            atual = ultimo_seq(conn)
+            conn.rollback()
             conn.close()
-            return jsonify({'error': 'Registro não encontrado'}), 404
+            return jsonify({
+                'error': 'since anterior ao horizonte do registro de alterações',
+                'horizonte': limite_compactacao,
+                'message': 'Baixe as tabelas novamente e continue a partir de ultimo_seq.',
+                'ultimo_seq': atual
+            }), 410
+
+        linhas = listar_alteracoes(conn, desde, limite + 1, tabela)
+        mais = len(linhas) > limite
+        linhas = linhas[:limite]
+
+        registros = {}
+        if com_dados:
+            ids_por_tabela = {}
+            for row in linhas:
+                if row['operacao'] != 'delete':
+                    ids_por_tabela.setdefault(row['tabela'], set()).add(row['id'])
+            for nome, ids in ids_por_tabela.items():
+                if not catalogo.existe(conn, nome):
+                    continue
+                colunas_json = colunas_json_requisicao(conn, nome)
+                ids = list(ids)
+                for inicio in range(0, len(ids), 500):
+                    parte = ids[inicio:inicio + 500]
+                    cursor = conn.execute(
+                        f'SELECT * FROM "{nome}" WHERE id IN ({", ".join(["?"] * len(parte))})', parte
+                    )
+                    for registro in cursor.fetchall():
+                        dados = dict(registro)
+                        id_registro = str(dados.pop('id'))
+                        registros[(nome, id_registro)] = parse_json_fields(dados, colunas_json)
+
+        alteracoes = []
+        for row in linhas:
+            alteracao = {
+                'seq': row['seq'],
+                'tabela': row['tabela'],
+                'id': row['id'],
+                'operacao': row['operacao'],
+                'quando': datetime.fromtimestamp(row['quando'], timezone.utc).isoformat(timespec='milliseconds')
+            }
+            if com_dados and row['operacao'] != 'delete':
+                # None se o registro foi excluído depois (a exclusão vem mais adiante)
+                alteracao['registro'] = registros.get((row['tabela'], row['id']))
+            alteracoes.append(alteracao)
+
+        atual = ultimo_seq(conn)
+        conn.rollback()
+        conn.close()
     except sqlite3.Error as e:
         conn.close()
         return jsonify({'error': str(e)}), 500
 
+    return jsonify_ordenado({
+        'alteracoes': alteracoes,
+        'since': alteracoes[-1]['seq'] if alteracoes else max(desde, atual),
+        'mais': mais,
+        'ultimo_seq': atual
+    })
+
+# Compactação manual do registro de alterações
+@app.route('/_changes/compactar', methods=['POST'])
+def compactar_changes():
+    if not admin_autorizado():
+        return acesso_negado()
+    conn = get_db_connection()
+    try:
+        removidas = trava_escrita.executar(conn, lambda conn: compactar(conn, ALTERACOES_RETENCAO_DIAS))
+        limite_compactacao = horizonte(conn)
+        conn.close()
+    except sqlite3.Error as e:
+        conn.close()
+        return erro_escrita(e)
+    return jsonify({'removidas': removidas, 'horizonte': limite_compactacao})
+
+# Compactação periódica. Cada worker roda a sua; rodar duas vezes seguidas não
+# muda nada, e a trava de escrita impede que duas rodem ao mesmo tempo.
+def compactar_periodicamente():
+    while True:
+        time.sleep(ALTERACOES_COMPACTAR_S * random.uniform(0.9, 1.1))
+        conn = None
+        try:
+            conn = get_db_connection()
+            removidas = trava_escrita.executar(conn, lambda conn: compactar(conn, ALTERACOES_RETENCAO_DIAS))
+            if removidas:
+                print(f"Registro de alterações compactado: {removidas} linha(s) removida(s)")
+        except sqlite3.Error as e:
+            print(f"ERRO ao compactar o registro de alterações: {str(e)}")
+        finally:
+            if conn is not None:
+                conn.close()
+
+if ALTERACOES_COMPACTAR_S > 0:
+    threading.Thread(target=compactar_periodicamente, daemon=True).start()
+
+# Posição de onde retomar os eventos: ?since ou o cabeçalho Last-Event-ID que o
+# EventSource envia ao reconectar. Levanta ValueError se não for um inteiro.
+def inicio_eventos(since, last_event_id):
+    valor = since if since is not None else last_event_id
+    return int(valor) if valor not in (None, '') else None
+
+# Texto inicial de uma conexão de eventos: o intervalo de reconexão, os eventos
+# perdidos desde "desde" até "ate" e o id da posição atual (que o EventSource
+# guarda e devolve em Last-Event-ID). Sem "ate", vai até o último seq do banco.
+def abertura_eventos(desde, ate, tabela):
+    partes = [f'retry: {EVENTOS_RECONEXAO_MS}\n\n']
+    if ate is None or (desde is not None and desde < ate):
+        conn = pool_conexoes.obter()
+        try:
+            if ate is None:
+                ate = ultimo_seq(conn)
+            if desde is not None:
+                eventos, _ = eventos_desde(conn, desde, EVENTOS_MAXIMO, ate)
+                partes.extend(filtrar(eventos, tabela))
+        finally:
+            conn.close()
+    partes.append(f'id: {ate}\n\n')
+    return ''.join(partes)
+
+# Eventos de alteração (Server-Sent Events). Cada commit que muda uma tabela
+# com registro de alterações gera um evento "alteracao" (seq, tabela, id,
+# operacao) ou, em lotes grandes, um evento "tabela". ?tabela=<nome> filtra.
+# Em workers síncronos de uma thread a conexão não pode ficar aberta: a
+# resposta traz só os eventos pendentes e o cliente reconecta depois de
+# EVENTOS_RECONEXAO_MS. No modo ASGI esta rota é atendida pelo servidor_asgi.
+@app.route('/_eventos')
+def transmitir_eventos():
+    tabela = request.args.get('tabela')
+    try:
+        desde = inicio_eventos(request.args.get('since'), request.headers.get('Last-Event-ID'))
+    except ValueError:
+        return jsonify({'error': 'since deve ser um inteiro'}), 400
+
+    # HEAD só confirma a rota: sem corpo não há o que assinar
+    if request.method == 'HEAD':
+        return Response(mimetype='text/event-stream')
+
+    if not request.environ.get('wsgi.multithread'):
+        try:
+            return Response(abertura_eventos(desde, None, tabela), mimetype='text/event-stream')
+        except sqlite3.Error as e:
+            return jsonify({'error': str(e)}), 500
+
+    fila = queue.Queue()
+    try:
+        token, ate = notificador_alteracoes.assinar(fila.put, tabela)
+    except sqlite3.Error as e:
+        return jsonify({'error': str(e)}), 500
+    try:
+        abertura = abertura_eventos(desde, ate, tabela)
+    except sqlite3.Error as e:
+        notificador_alteracoes.cancelar(token)
+        return jsonify({'error': str(e)}), 500
+
+    def gerar():
+        yield abertura
+        fim = time.monotonic() + EVENTOS_DURACAO_S
+        while True:
+            restante = fim - time.monotonic()
+            if restante <= 0:
+                return
+            try:
+                textos = fila.get(timeout=min(EVENTOS_PING_S, restante))
+            except queue.Empty:
+                yield ': ping\n\n'
+                continue
+            yield ''.join(textos)
+
+    response = Response(gerar(), mimetype='text/event-stream', headers={'X-Accel-Buffering': 'no'})
+    # A assinatura termina no close() da resposta, que o servidor chama mesmo
+    # quando o corpo nunca chega a ser lido
+    response.call_on_close(lambda: notificador_alteracoes.cancelar(token))
+    return response
+
+# Inicialização do worker: uma única verificação idempotente do esquema.
+# Sob o gunicorn a porta já foi aberta pelo processo mestre antes desta
+# importação; o diagnóstico do banco fica para depois, em segundo plano.
+registrar_fase('importacao', INICIO_IMPORTACAO)
+_inicio_esquema = time.perf_counter()
+ensure_tables_exist()
+registrar_fase('esquema', _inicio_esquema)
+registrar_fase('pronto', INICIO_IMPORTACAO)
+threading.Thread(target=diagnosticar_banco, daemon=True).start()
+print(f"Servidor pronto em {tempos_inicio['pronto']} ms")
+
 if __name__ == '__main__':
-    # Garantir que as tabelas existam antes de iniciar o servidor
-    ensure_tables_exist()
-    
     # Configuração para deploy no Render
     port = int(os.environ.get('PORT', 5000))
     app.run(host='0.0.0.0', port=port) 
\ No newline at end of file
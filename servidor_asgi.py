@@ -0,0 +1,248 @@
+import asyncio
+import io
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+from servidor import (
+    app as app_flask, DB_POOL_SIZE, EVENTOS_PING_S, EVENTOS_DURACAO_S,
+    notificador_alteracoes, inicio_eventos, abertura_eventos
+)
+
+# Modo de execução assíncrono (ASGI) do servidor. Expõe as mesmas rotas do
+# app Flask, mas as conexões HTTP ficam no loop asyncio do uvicorn: clientes
+# lentos e conexões keep-alive ociosas não ocupam uma thread cada. Só o
+# trabalho do Flask/SQLite roda em um pool de threads limitado, do tamanho do
+# pool de conexões por padrão, para que nenhuma thread fique esperando conexão.
+#
+# Uso:
+#   uvicorn servidor_asgi:app --host 0.0.0.0 --port $PORT
+#   gunicorn servidor_asgi:app -k uvicorn.workers.UvicornWorker --bind 0.0.0.0:$PORT
+
+ASGI_THREADS = int(os.environ.get('ASGI_THREADS', DB_POOL_SIZE))
+# Tamanho máximo do corpo de uma requisição (o PUT em lote é o maior caso)
+ASGI_MAX_CORPO = int(os.environ.get('ASGI_MAX_CORPO', 64 * 1024 * 1024))
+
+executor_sqlite = ThreadPoolExecutor(max_workers=ASGI_THREADS, thread_name_prefix='sqlite')
+
+class CorpoMuitoGrande(Exception):
+    pass
+
+class ClienteDesconectado(Exception):
+    pass
+
+# Monta o environ WSGI a partir do scope ASGI
+def ambiente_wsgi(scope, corpo):
+    servidor = scope.get('server') or ('localhost', 80)
+    cliente = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': str(servidor[0]),
+        'SERVER_PORT': str(servidor[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': cliente[0],
+        'REMOTE_PORT': str(cliente[1]),
+        'CONTENT_LENGTH': str(len(corpo)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(corpo),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False
+    }
+    for nome, valor in scope.get('headers', []):
+        nome = nome.decode('latin-1').upper().replace('-', '_')
+        valor = valor.decode('latin-1')
+        if nome == 'CONTENT_TYPE':
+            environ['CONTENT_TYPE'] = valor
+            continue
+        if nome == 'CONTENT_LENGTH':
+            continue
+        chave = f'HTTP_{nome}'
+        environ[chave] = f'{environ[chave]},{valor}' if chave in environ else valor
+    return environ
+
+async def ler_corpo(receive):
+    partes = []
+    total = 0
+    while True:
+        mensagem = await receive()
+        if mensagem['type'] == 'http.disconnect':
+            raise ClienteDesconectado()
+        parte = mensagem.get('body', b'')
+        total += len(parte)
+        if total > ASGI_MAX_CORPO:
+            raise CorpoMuitoGrande()
+        partes.append(parte)
+        if not mensagem.get('more_body', False):
+            return b''.join(partes)
+
+# Chama o app Flask e lê o primeiro pedaço da resposta, tudo em uma thread do pool
+def iniciar_resposta(environ):
+    inicio = {}
+    def start_response(status, cabecalhos, exc_info=None):
+        inicio['status'] = int(status.split(' ', 1)[0])
+        inicio['cabecalhos'] = [
+            (nome.lower().encode('latin-1'), valor.encode('latin-1'))
+            for nome, valor in cabecalhos
+        ]
+        return lambda dados: None
+    resultado = app_flask(environ, start_response)
+    iterador = iter(resultado)
+    try:
+        primeiro = next(iterador, None)
+    except BaseException:
+        fechar_resposta(resultado)
+        raise
+    return inicio, resultado, iterador, primeiro
+
+def fechar_resposta(resultado):
+    fechar = getattr(resultado, 'close', None)
+    if fechar is not None:
+        fechar()
+
+async def responder_erro(send, status, mensagem):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json')]
+    })
+    await send({'type': 'http.response.body', 'body': mensagem})
+
+# /_eventos atendido no próprio loop: cada conexão aberta custa uma corrotina e
+# uma fila, sem thread. Os eventos chegam da thread do notificador por
+# call_soon_threadsafe; só a leitura dos eventos perdidos usa o pool de threads.
+async def transmitir_eventos(scope, receive, send):
+    parametros = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+    cabecalhos = dict(scope.get('headers', []))
+    tabela = parametros.get('tabela', [None])[0]
+    try:
+        desde = inicio_eventos(
+            parametros.get('since', [None])[0],
+            cabecalhos.get(b'last-event-id', b'').decode('latin-1') or None
+        )
+    except ValueError:
+        await responder_erro(send, 400, b'{"error":"since deve ser um inteiro"}\n')
+        return
+
+    loop = asyncio.get_running_loop()
+    fila = asyncio.Queue()
+    entregar = lambda textos: loop.call_soon_threadsafe(fila.put_nowait, textos)
+    token, ate = await loop.run_in_executor(executor_sqlite, notificador_alteracoes.assinar, entregar, tabela)
+    vigia = None
+    try:
+        abertura = await loop.run_in_executor(executor_sqlite, abertura_eventos, desde, ate, tabela)
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [
+                (b'content-type', b'text/event-stream; charset=utf-8'),
+                (b'cache-control', b'no-store'),
+                (b'x-accel-buffering', b'no'),
+                (b'access-control-allow-origin', b'*')
+            ]
+        })
+        await send({'type': 'http.response.body', 'body': abertura.encode('utf-8'), 'more_body': True})
+
+        async def aguardar_desconexao():
+            while (await receive())['type'] != 'http.disconnect':
+                pass
+        vigia = asyncio.create_task(aguardar_desconexao())
+        fim = loop.time() + EVENTOS_DURACAO_S
+        while not vigia.done():
+            restante = fim - loop.time()
+            if restante <= 0:
+                await send({'type': 'http.response.body', 'body': b''})
+                return
+            proximos = asyncio.ensure_future(fila.get())
+            await asyncio.wait({proximos, vigia}, timeout=min(EVENTOS_PING_S, restante),
+                               return_when=asyncio.FIRST_COMPLETED)
+            if proximos.done():
+                corpo = ''.join(proximos.result())
+            else:
+                proximos.cancel()
+                if vigia.done():
+                    return
+                corpo = ': ping\n\n'
+            await send({'type': 'http.response.body', 'body': corpo.encode('utf-8'), 'more_body': True})
+    finally:
+        notificador_alteracoes.cancelar(token)
+        if vigia is not None:
+            vigia.cancel()
+
+async def tratar_ciclo_de_vida(receive, send):
+    while True:
+        mensagem = await receive()
+        if mensagem['type'] == 'lifespan.startup':
+            # O esquema já foi verificado na importação de servidor.py
+            await send({'type': 'lifespan.startup.complete'})
+        elif mensagem['type'] == 'lifespan.shutdown':
+            executor_sqlite.shutdown(wait=True)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await tratar_ciclo_de_vida(receive, send)
+        return
+    if scope['type'] != 'http':
+        return
+    if scope['path'] == '/_eventos' and scope['method'] == 'GET':
+        await transmitir_eventos(scope, receive, send)
+        return
+
+    try:
+        corpo = await ler_corpo(receive)
+    except ClienteDesconectado:
+        return
+    except CorpoMuitoGrande:
+        await responder_erro(send, 413, b'{"error":"Corpo da requisi\\u00e7\\u00e3o muito grande"}\n')
+        return
+
+    loop = asyncio.get_running_loop()
+    inicio, resultado, iterador, pedaco = await loop.run_in_executor(
+        executor_sqlite, iniciar_resposta, ambiente_wsgi(scope, corpo)
+    )
+
+    # Percebe quando o cliente desiste no meio de uma resposta em streaming
+    desconectado = asyncio.Event()
+    async def aguardar_desconexao():
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+        desconectado.set()
+    vigia = asyncio.create_task(aguardar_desconexao())
+
+    try:
+        await send({
+            'type': 'http.response.start',
+            'status': inicio['status'],
+            'headers': inicio['cabecalhos']
+        })
+        # Cada pedaço é gerado em uma thread do pool, mas o envio acontece no
+        # loop: um cliente lento não segura a thread enquanto o pedaço anterior
+        # ainda está sendo transmitido. A conexão SQLite do stream fica aberta
+        # até o fim da transferência, mas é avulsa (fora do pool do servidor).
+        if pedaco is None:
+            await send({'type': 'http.response.body', 'body': b''})
+        while pedaco is not None and not desconectado.is_set():
+            proximo = await loop.run_in_executor(executor_sqlite, next, iterador, None)
+            await send({
+                'type': 'http.response.body',
+                'body': bytes(pedaco),
+                'more_body': proximo is not None
+            })
+            pedaco = proximo
+    finally:
+        vigia.cancel()
+        await loop.run_in_executor(executor_sqlite, fechar_resposta, resultado)
+
+if __name__ == '__main__':
+    import uvicorn
+
+    port = int(os.environ.get('PORT', 5000))
+    uvicorn.run('servidor_asgi:app', host='0.0.0.0', port=port, proxy_headers=True)
@@ -4,55 +4,54 @@ import json
 import time
 import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from requests.adapters import HTTPAdapter
+
+from migracoes import aplicar_migracoes
+from arvore_merkle import ArvoreMerkle, DIGITOS, formatar_hash
 
 # Configurações
 BANCO_LOCAL = 'C:\\sqlite\\meu_banco.db'
 API_URL = 'https://server-qx03.onrender.com'  # Substitua pelo seu URL do Render
 INTERVALO_SYNC = 300  # Sincronizar a cada 5 minutos
 PRIORIZAR_LOCAL = True  # Priorizar dados locais em caso de conflito
+TAMANHO_LOTE = 500  # Registros enviados por requisição ao Render
+MERKLE_PREFIXOS_POR_REQUISICAO = 200  # Nós da árvore pedidos de uma vez
+TAMANHO_MAXIMO_IDS_URL = 3000  # Caracteres de ids por GET ?id__in= (o gunicorn limita a linha a 4 KB)
+TRANSFERENCIAS_PARALELAS = 4  # Requisições simultâneas ao Render (lotes, páginas da árvore Merkle)
+
+# Sessão HTTP compartilhada: as conexões (e o TLS) com o Render são
+# reaproveitadas entre requisições. O pool comporta as transferências
+# paralelas, a busca antecipada da próxima tabela e a thread principal.
+sessao = requests.Session()
+sessao.mount('https://', HTTPAdapter(pool_maxsize=TRANSFERENCIAS_PARALELAS + 2))
+sessao.mount('http://', HTTPAdapter(pool_maxsize=TRANSFERENCIAS_PARALELAS + 2))
+
+# Transferências em paralelo (limitadas) e a busca antecipada da próxima
+# tabela, em executores separados: a busca espera pelas transferências e não
+# pode ocupar uma das vagas delas
+transferencias = ThreadPoolExecutor(max_workers=TRANSFERENCIAS_PARALELAS, thread_name_prefix='transferencia')
+busca_antecipada = ThreadPoolExecutor(max_workers=1, thread_name_prefix='busca_antecipada')
 
 def obter_tabelas_local():
     """Obtém a lista de tabelas do banco de dados local"""
     conn = sqlite3.connect(BANCO_LOCAL)
+    # Garante o esquema local (inclusive a tabela churches) antes de listar
+    aplicadas = aplicar_migracoes(conn)
+    if aplicadas:
+        print(f"Migrações aplicadas no banco local: {aplicadas}")
     cursor = conn.cursor()
     cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
-    tabelas = [row[0] for row in cursor.fetchall() if row[0] != 'sqlite_sequence']
+    # Tabelas de controle (sqlite_sequence, _schema_version...) não são sincronizadas
+    tabelas = [row[0] for row in cursor.fetchall() if row[0] != 'sqlite_sequence' and not row[0].startswith('_')]
     conn.close()
-    
-    # Verificar se churches está entre as tabelas
-    if 'churches' not in tabelas:
-        print("AVISO: Tabela 'churches' não encontrada no banco local!")
-        # Tentar criar a tabela
-        try:
-            print("Tentando criar tabela 'churches' automaticamente...")
-            conn = sqlite3.connect(BANCO_LOCAL)
-            cursor = conn.cursor()
-            cursor.execute('''
-            CREATE TABLE IF NOT EXISTS churches (
-                id TEXT PRIMARY KEY,
-                nome TEXT,
-                morada TEXT,
-                ano TEXT,
-                agendamento TEXT,
-                autorizadoFilippi TEXT,
-                arquivada INTEGER DEFAULT 0,
-                dados TEXT
-            )
-            ''')
-            conn.commit()
-            conn.close()
-            print("Tabela 'churches' criada com sucesso!")
-            tabelas.append('churches')
-        except Exception as e:
-            print(f"Erro ao criar tabela 'churches': {e}")
-    
     return tabelas
 
 def obter_tabelas_render():
     """Obtém a lista de tabelas do banco de dados no Render"""
     try:
-        response = requests.get(f"{API_URL}/tabelas")
+        response = sessao.get(f"{API_URL}/tabelas")
         if response.status_code == 200:
             return response.json().get('tabelas', [])
         print(f"Erro ao obter tabelas do Render: {response.status_code}")
@@ -77,27 +76,31 @@ def obter_dados_tabela_local(tabela):
     conn.close()
     return registros
 
+# Última resposta de cada tabela do Render, reaproveitada quando o servidor responde 304
+cache_tabelas_render = {}
+
 def obter_dados_tabela_render(tabela):
     """Obtém todos os dados de uma tabela no Render"""
     try:
-        response = requests.get(f"{API_URL}/{tabela}")
+        headers = {}
+        if tabela in cache_tabelas_render:
+            headers['If-None-Match'] = cache_tabelas_render[tabela][0]
+        response = sessao.get(f"{API_URL}/{tabela}", params={'stream': '1'}, headers=headers)
+        if response.status_code == 304:
+            return cache_tabelas_render[tabela][1]
         if response.status_code == 200:
-            return response.json()
+            dados = response.json()
+            if response.headers.get('ETag'):
+                cache_tabelas_render[tabela] = (response.headers['ETag'], dados)
+            return dados
         print(f"Erro ao obter dados da tabela {tabela} do Render: {response.status_code}")
         return {}
     except Exception as e:
         print(f"Erro de conexão com o Render: {e}")
         return {}
 
-def atualizar_registro_local(tabela, id_registro, dados):
-    """Atualiza ou insere um registro no banco local"""
-    conn = sqlite3.connect(BANCO_LOCAL)
-    cursor = conn.cursor()
-    
-    # Verifica quais colunas existem na tabela
-    cursor.execute(f"PRAGMA table_info({tabela})")
-    colunas = [info[1] for info in cursor.fetchall() if info[1] != 'id']
-    
+def gravar_registro_local(cursor, tabela, colunas, id_registro, dados):
+    """Atualiza ou insere um registro com o cursor informado, sem commit"""
     # Filtra os dados para incluir apenas colunas válidas
     valores = []
     campos = []
@@ -111,7 +114,6 @@ def atualizar_registro_local(tabela, id_registro, dados):
             valores.append(valor)
     
     if not campos:
-        conn.close()
         return False
     
     # Verifica se o registro já existe
@@ -128,15 +130,34 @@ def atualizar_registro_local(tabela, id_registro, dados):
         placeholders = ', '.join(['?'] * len(campos))
         query = f"INSERT INTO {tabela} (id, {', '.join(campos)}) VALUES (?, {placeholders})"
         cursor.execute(query, [id_registro] + valores)
+    return True
+
+def atualizar_registros_local(tabela, registros):
+    """Atualiza ou insere vários registros no banco local em uma única transação"""
+    conn = sqlite3.connect(BANCO_LOCAL)
+    cursor = conn.cursor()
+    
+    # Verifica quais colunas existem na tabela
+    cursor.execute(f"PRAGMA table_info({tabela})")
+    colunas = [info[1] for info in cursor.fetchall() if info[1] != 'id']
+    
+    gravados = [
+        id_registro for id_registro, dados in registros.items()
+        if gravar_registro_local(cursor, tabela, colunas, id_registro, dados)
+    ]
     
     conn.commit()
     conn.close()
-    return True
+    return gravados
+
+def atualizar_registro_local(tabela, id_registro, dados):
+    """Atualiza ou insere um registro no banco local"""
+    return bool(atualizar_registros_local(tabela, {id_registro: dados}))
 
 def atualizar_registro_render(tabela, id_registro, dados):
     """Atualiza ou insere um registro no Render"""
     try:
-        response = requests.put(f"{API_URL}/{tabela}/{id_registro}", json=dados)
+        response = sessao.put(f"{API_URL}/{tabela}/{id_registro}", json=dados)
         if response.status_code in [200, 201]:
             return True
         print(f"Erro ao atualizar registro {id_registro} na tabela {tabela} no Render: {response.status_code}")
@@ -145,6 +166,45 @@ def atualizar_registro_render(tabela, id_registro, dados):
         print(f"Erro de conexão com o Render: {e}")
         return False
 
+def enviar_lote_render(tabela, lote):
+    """Envia um lote de registros ao Render (PUT /<tabela>) e devolve os ids gravados"""
+    enviados = []
+    try:
+        response = sessao.put(f"{API_URL}/{tabela}", json=lote)
+    except Exception as e:
+        print(f"Erro de conexão com o Render: {e}")
+        return enviados
+
+    if response.status_code in [404, 405]:
+        # Servidor sem a rota de lote: envia um registro por vez
+        for id_registro, dados in lote.items():
+            if atualizar_registro_render(tabela, id_registro, dados):
+                enviados.append(id_registro)
+        return enviados
+    if response.status_code != 200:
+        print(f"Erro ao enviar lote da tabela {tabela} para o Render: {response.status_code}")
+        return enviados
+
+    for id_registro, resultado in response.json().get('resultados', {}).items():
+        if resultado.get('status') == 'erro':
+            print(f"Erro ao atualizar registro {id_registro} na tabela {tabela} no Render: {resultado.get('error')}")
+        else:
+            enviados.append(id_registro)
+    return enviados
+
+def atualizar_registros_render_lote(tabela, registros):
+    """Envia vários registros ao Render em lotes (PUT /<tabela>), um por transação,
+    com até TRANSFERENCIAS_PARALELAS lotes em andamento ao mesmo tempo"""
+    ids = list(registros)
+    lotes = [
+        {id_registro: registros[id_registro] for id_registro in ids[inicio:inicio + TAMANHO_LOTE]}
+        for inicio in range(0, len(ids), TAMANHO_LOTE)
+    ]
+    enviados = []
+    for enviados_lote in transferencias.map(lambda lote: enviar_lote_render(tabela, lote), lotes):
+        enviados.extend(enviados_lote)
+    return enviados
+
 def criar_tabela_local(tabela, campos):
     """Cria uma tabela no banco local caso não exista"""
     conn = sqlite3.connect(BANCO_LOCAL)
@@ -169,6 +229,221 @@ def obter_ultima_modificacao_local(tabela, id_registro):
     # Por enquanto, consideramos que local é sempre mais recente se a opção estiver ativa
     return PRIORIZAR_LOCAL
 
+def obter_colunas_local(tabela):
+    """Obtém as colunas de uma tabela local, sem o id"""
+    conn = sqlite3.connect(BANCO_LOCAL)
+    colunas = [info[1] for info in conn.execute(f"PRAGMA table_info({tabela})").fetchall() if info[1] != 'id']
+    conn.close()
+    return colunas
+
+def construir_arvore_local(tabela, colunas):
+    """Monta a árvore Merkle da tabela local sobre as colunas informadas"""
+    conn = sqlite3.connect(BANCO_LOCAL)
+    selecao = ', '.join(['"id"'] + [f'"{coluna}"' for coluna in colunas])
+    # A leitura termina antes do cálculo dos hashes, que não segura o banco
+    linhas = conn.execute(f'SELECT {selecao} FROM "{tabela}"').fetchall()
+    conn.close()
+    return ArvoreMerkle.construir((row[0], row[1:]) for row in linhas)
+
+def consultar_merkle_render(tabela, prefixos, colunas):
+    """Obtém nós da árvore Merkle de uma tabela no Render (None se o servidor não tiver a rota)"""
+    response = sessao.get(
+        f"{API_URL}/{tabela}/_merkle",
+        params={'prefixo': prefixos, 'colunas': ','.join(colunas)}
+    )
+    if response.status_code == 200:
+        return response.json(), len(response.content)
+    if response.status_code not in [404, 405]:
+        print(f"Erro ao obter a árvore Merkle da tabela {tabela} do Render: {response.status_code}")
+    return None, len(response.content)
+
+def comparar_merkle(tabela, resposta, baixados):
+    """Compara as árvores Merkle local e do Render descendo só pelos nós diferentes,
+    a partir da raiz já obtida do Render (resposta, com "baixados" bytes).
+    Devolve (ids só no Render, ids só no local, ids com conteúdo diferente),
+    ou None se não for possível comparar"""
+    # Só as colunas que existem nos dois lados entram nos hashes
+    colunas = resposta['colunas']
+    arvore = construir_arvore_local(tabela, colunas)
+    so_render, so_local, diferentes = [], [], []
+    requisicoes = 1
+    nos = resposta['nos']
+    while nos:
+        pendentes = []
+        for prefixo, remoto in nos.items():
+            hash_local, total_local = arvore.no(prefixo)
+            if remoto['hash'] == formatar_hash(hash_local) and remoto['total'] == total_local:
+                continue
+            if 'registros' in remoto:
+                # Nó pequeno: o servidor mandou o hash de cada registro
+                locais = arvore.registros(prefixo)
+                for id_registro, hash_remoto in remoto['registros'].items():
+                    if id_registro not in locais:
+                        so_render.append(id_registro)
+                    elif formatar_hash(locais[id_registro]) != hash_remoto:
+                        diferentes.append(id_registro)
+                so_local.extend(id_registro for id_registro in locais if id_registro not in remoto['registros'])
+                continue
+            for digito in DIGITOS:
+                filho = prefixo + digito
+                remoto_filho = remoto['filhos'].get(filho)
+                hash_filho, total_filho = arvore.no(filho)
+                if remoto_filho is None:
+                    # Vazio no Render: tudo o que houver aqui só existe no local
+                    so_local.extend(arvore.registros(filho))
+                elif remoto_filho['hash'] != formatar_hash(hash_filho) or remoto_filho['total'] != total_filho:
+                    pendentes.append(filho)
+
+        # Os nós de um nível são pedidos em paralelo
+        partes = [
+            pendentes[inicio:inicio + MERKLE_PREFIXOS_POR_REQUISICAO]
+            for inicio in range(0, len(pendentes), MERKLE_PREFIXOS_POR_REQUISICAO)
+        ]
+        nos = {}
+        try:
+            respostas = list(transferencias.map(
+                lambda parte: consultar_merkle_render(tabela, parte, colunas), partes
+            ))
+        except Exception as e:
+            print(f"Erro de conexão com o Render: {e}")
+            return None
+        for resposta_parte, tamanho in respostas:
+            if resposta_parte is None:
+                return None
+            requisicoes += 1
+            baixados += tamanho
+            nos.update(resposta_parte['nos'])
+
+    print(f"  {tabela}: árvore Merkle comparada em {requisicoes} requisição(ões), {baixados / 1024:.1f} KB: "
+          f"{len(so_render)} só no Render, {len(so_local)} só no local, {len(diferentes)} diferentes")
+    return so_render, so_local, diferentes
+
+def obter_registros_local(tabela, ids):
+    """Obtém da tabela local os registros com os ids informados"""
+    conn = sqlite3.connect(BANCO_LOCAL)
+    conn.row_factory = sqlite3.Row
+    registros = {}
+    for inicio in range(0, len(ids), 500):
+        parte = ids[inicio:inicio + 500]
+        cursor = conn.execute(f"SELECT * FROM {tabela} WHERE id IN ({', '.join(['?'] * len(parte))})", parte)
+        for row in cursor.fetchall():
+            data = dict(row)
+            registros[str(data.pop('id'))] = data
+    conn.close()
+    return registros
+
+def obter_registros_render(tabela, ids):
+    """Obtém do Render os registros com os ids informados (valores brutos, como estão no banco)"""
+    registros = {}
+    # ids com vírgula não cabem em ?id__in= e são buscados um a um
+    avulsos = [id_registro for id_registro in ids if ',' in id_registro]
+    grupo, tamanho = [], 0
+    grupos = []
+    for id_registro in ids:
+        if ',' in id_registro:
+            continue
+        if grupo and (tamanho + len(id_registro) > TAMANHO_MAXIMO_IDS_URL or len(grupo) >= 500):
+            grupos.append(grupo)
+            grupo, tamanho = [], 0
+        grupo.append(id_registro)
+        tamanho += len(id_registro) + 1
+    if grupo:
+        grupos.append(grupo)
+
+    def obter_grupo(grupo):
+        response = sessao.get(
+            f"{API_URL}/{tabela}",
+            params={'id__in': ','.join(grupo), 'limit': len(grupo), 'bruto': '1'}
+        )
+        if response.status_code != 200:
+            print(f"Erro ao obter registros da tabela {tabela} do Render: {response.status_code}")
+            return {}
+        return response.json().get('registros', {})
+
+    def obter_avulso(id_registro):
+        response = sessao.get(f"{API_URL}/{tabela}/{id_registro}", params={'bruto': '1'})
+        return response.json() if response.status_code == 200 else {}
+
+    try:
+        for parte in transferencias.map(obter_grupo, grupos):
+            registros.update(parte)
+        for parte in transferencias.map(obter_avulso, avulsos):
+            registros.update(parte)
+    except Exception as e:
+        print(f"Erro de conexão com o Render: {e}")
+    return registros
+
+def sincronizar_diferencas(tabela, so_local, diferentes, baixados):
+    """Aplica o resultado da comparação das árvores Merkle: envia os registros
+    locais apontados e grava os que foram baixados do Render"""
+    # Mesmas regras da sincronização completa: registros novos vão para o outro
+    # lado; os diferentes só sobem se os dados locais tiverem prioridade
+    ids_enviar = so_local + (diferentes if PRIORIZAR_LOCAL else [])
+    if ids_enviar:
+        for id_registro in atualizar_registros_render_lote(tabela, obter_registros_local(tabela, ids_enviar)):
+            print(f"  Enviado registro {id_registro} da tabela {tabela} para o Render")
+
+    for id_registro in atualizar_registros_local(tabela, baixados):
+        print(f"  Baixado novo registro {id_registro} da tabela {tabela} para o local")
+
+def buscar_tabela(tabela, colunas):
+    """Parte da sincronização de uma tabela feita na busca antecipada, só com o
+    Render: a raiz da árvore Merkle sobre as colunas locais ou, sem a tabela
+    local (colunas None) ou sem a rota no Render, a tabela inteira. Não abre o
+    banco local, que pode estar sendo gravado pela thread principal"""
+    if colunas is not None:
+        try:
+            resposta, baixados = consultar_merkle_render(tabela, [''], colunas)
+        except Exception as e:
+            print(f"Erro de conexão com o Render: {e}")
+            resposta = None
+        if resposta is not None:
+            return {'raiz': resposta, 'baixados': baixados}
+    return {'dados_render': obter_dados_tabela_render(tabela)}
+
+def aplicar_tabela(tabela, buscada, tabelas_local):
+    """Compara a árvore local com a do Render (ou usa a tabela inteira buscada),
+    grava no banco local o que falta e envia ao Render os registros locais"""
+    if 'raiz' in buscada:
+        diferencas = comparar_merkle(tabela, buscada['raiz'], buscada['baixados'])
+        if diferencas is not None:
+            so_render, so_local, diferentes = diferencas
+            baixados = obter_registros_render(tabela, so_render) if so_render else {}
+            sincronizar_diferencas(tabela, so_local, diferentes, baixados)
+            return
+        buscada = {'dados_render': obter_dados_tabela_render(tabela)}
+
+    dados_render = buscada['dados_render']
+    
+    # Cria a tabela localmente se não existir
+    if tabela not in tabelas_local and dados_render:
+        # Pega os campos do primeiro registro como modelo
+        primeiro_id = list(dados_render.keys())[0]
+        campos = list(dados_render[primeiro_id].keys())
+        criar_tabela_local(tabela, campos)
+        tabelas_local.append(tabela)  # Atualiza a lista local
+    
+    # Agora obtém os dados locais (após possível criação da tabela)
+    dados_local = obter_dados_tabela_local(tabela) if tabela in tabelas_local else {}
+    
+    # Processa registros do local para o Render (PRIORIDADE)
+    # Se não existe no Render ou os dados locais têm prioridade
+    para_enviar = {
+        id_registro: dados for id_registro, dados in dados_local.items()
+        if id_registro not in dados_render or PRIORIZAR_LOCAL
+    }
+    for id_registro in atualizar_registros_render_lote(tabela, para_enviar):
+        print(f"  Enviado registro {id_registro} da tabela {tabela} para o Render")
+    
+    # Processa registros do Render para o local (APENAS NOVOS REGISTROS),
+    # todos em uma transação (não sobrescreve dados locais)
+    novos = {
+        id_registro: dados for id_registro, dados in dados_render.items()
+        if id_registro not in dados_local
+    }
+    for id_registro in atualizar_registros_local(tabela, novos):
+        print(f"  Baixado novo registro {id_registro} da tabela {tabela} para o local")
+
 def sincronizar():
     """Sincroniza os bancos de dados local e Render"""
     print(f"[{datetime.now()}] Iniciando sincronização...")
@@ -186,37 +461,20 @@ def sincronizar():
     tabelas_local = obter_tabelas_local()
     tabelas_render = obter_tabelas_render()
     
-    # Para cada tabela no Render, sincroniza com o local
-    for tabela in tabelas_render:
+    # Para cada tabela no Render, sincroniza com o local. Enquanto uma tabela
+    # é aplicada, a próxima já está sendo buscada no Render. As colunas locais
+    # são lidas aqui: o banco local só é usado pela thread principal
+    def buscar(tabela):
+        colunas = obter_colunas_local(tabela) if tabela in tabelas_local else None
+        return busca_antecipada.submit(buscar_tabela, tabela, colunas)
+
+    proxima = buscar(tabelas_render[0]) if tabelas_render else None
+    for indice, tabela in enumerate(tabelas_render):
         print(f"Sincronizando tabela: {tabela}")
-        
-        # Obtém os dados de ambos os lados
-        dados_render = obter_dados_tabela_render(tabela)
-        
-        # Cria a tabela localmente se não existir
-        if tabela not in tabelas_local and dados_render:
-            # Pega os campos do primeiro registro como modelo
-            primeiro_id = list(dados_render.keys())[0]
-            campos = list(dados_render[primeiro_id].keys())
-            criar_tabela_local(tabela, campos)
-            tabelas_local.append(tabela)  # Atualiza a lista local
-        
-        # Agora obtém os dados locais (após possível criação da tabela)
-        dados_local = obter_dados_tabela_local(tabela) if tabela in tabelas_local else {}
-        
-        # Processa registros do local para o Render (PRIORIDADE)
-        for id_registro, dados in dados_local.items():
-            # Se não existe no Render ou os dados locais têm prioridade
-            if id_registro not in dados_render or PRIORIZAR_LOCAL:
-                atualizar_registro_render(tabela, id_registro, dados)
-                print(f"  Enviado registro {id_registro} da tabela {tabela} para o Render")
-        
-        # Processa registros do Render para o local (APENAS NOVOS REGISTROS)
-        for id_registro, dados in dados_render.items():
-            # Apenas se não existir localmente (não sobrescreve dados locais)
-            if id_registro not in dados_local:
-                atualizar_registro_local(tabela, id_registro, dados)
-                print(f"  Baixado novo registro {id_registro} da tabela {tabela} para o local")
+        buscada = proxima.result()
+        if indice + 1 < len(tabelas_render):
+            proxima = buscar(tabelas_render[indice + 1])
+        aplicar_tabela(tabela, buscada, tabelas_local)
     
     print(f"[{datetime.now()}] Sincronização concluída!")
 
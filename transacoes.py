@@ -0,0 +1,83 @@
+import random
+import sqlite3
+import threading
+import time
+
+# Início das transações de escrita. BEGIN IMMEDIATE pega a trava de escrita
+# logo no começo: em modo WAL, uma transação que já tem a trava não recebe
+# mais SQLITE_BUSY no meio do caminho, então basta tratar a disputa aqui.
+# Cada tentativa espera até o busy_timeout da conexão; se ainda assim o banco
+# estiver travado, tenta de novo após uma pausa exponencial com jitter, até
+# o número máximo de tentativas.
+
+# Esperas mais curtas que isso não contam como disputa pela trava
+ESPERA_MINIMA = 0.001
+
+def banco_travado(erro):
+    mensagem = str(erro).lower()
+    return 'database is locked' in mensagem or 'database is busy' in mensagem
+
+class TravaEscrita:
+    def __init__(self, tentativas=3, pausa_base_ms=25, pausa_maxima_ms=500):
+        self.tentativas = max(1, tentativas)
+        self.pausa_base = pausa_base_ms / 1000
+        self.pausa_maxima = pausa_maxima_ms / 1000
+        self._trava = threading.Lock()
+        self.transacoes = 0
+        self.esperas = 0
+        self.tempo_espera = 0.0
+        self.maior_espera = 0.0
+        self.retentativas = 0
+        self.desistencias = 0
+
+    def iniciar(self, conn):
+        inicio = time.perf_counter()
+        try:
+            for tentativa in range(self.tentativas):
+                try:
+                    conn.execute("BEGIN IMMEDIATE")
+                    return
+                except sqlite3.OperationalError as e:
+                    if not banco_travado(e):
+                        raise
+                    if tentativa == self.tentativas - 1:
+                        with self._trava:
+                            self.desistencias += 1
+                        raise
+                    with self._trava:
+                        self.retentativas += 1
+                    # "Full jitter": pausa aleatória entre zero e o teto da tentativa
+                    teto = min(self.pausa_maxima, self.pausa_base * (2 ** tentativa))
+                    time.sleep(random.uniform(0, teto))
+        finally:
+            espera = time.perf_counter() - inicio
+            with self._trava:
+                self.transacoes += 1
+                if espera >= ESPERA_MINIMA:
+                    self.esperas += 1
+                    self.tempo_espera += espera
+                    self.maior_espera = max(self.maior_espera, espera)
+
+    # Executa funcao(conn) em uma transação de escrita e faz o commit
+    def executar(self, conn, funcao):
+        self.iniciar(conn)
+        try:
+            resultado = funcao(conn)
+            conn.commit()
+            return resultado
+        except BaseException:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+
+    def estatisticas(self):
+        with self._trava:
+            return {
+                'transacoes': self.transacoes,
+                'esperas_trava': self.esperas,
+                'tempo_espera_ms': round(self.tempo_espera * 1000, 3),
+                'maior_espera_ms': round(self.maior_espera * 1000, 3),
+                'retentativas': self.retentativas,
+                'desistencias': self.desistencias,
+                'tentativas_maximas': self.tentativas
+            }